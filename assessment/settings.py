@@ -45,9 +45,9 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.BasicAuthentication',
+        'dependencynetwork.authentication.CachedBasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'dependencynetwork.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -55,9 +55,34 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.MultiPartParser',
-    )
+    ),
+    'EXCEPTION_HANDLER': 'dependencynetwork.exceptions.exception_handler',
 }
 
+# in-process cache of loaded dependency networks, capped by the total number of tasks + dependencies it holds
+DEPENDENCY_GRAPH_CACHE_SIZE = 1000000
+# in-process cache of rendered GET /dependency-network/<aircraft_type> responses, capped in bytes
+DEPENDENCY_NETWORK_RESPONSE_CACHE_SIZE = 100 * 1024 * 1024
+# in-process cache of reachability indexes (one bit per pair of tasks of a network), capped in bytes
+REACHABILITY_CACHE_SIZE = 100 * 1024 * 1024
+
+# batch schedule evaluation: scenarios are evaluated in chunks of this many rows, spread over this many worker
+# processes if set (0 evaluates all chunks in the request process). workers are spawned per batch, which takes a
+# django start-up each, so they only pay off for batches of many chunks
+SCHEDULE_BATCH_CHUNK_SIZE = 1000
+SCHEDULE_BATCH_WORKERS = 0
+# baseline schedules (the what-if starting point) of the last this many ground times are kept per cached network
+SCHEDULE_BASELINE_CACHE_SIZE = 8
+
+# successful token and basic auth logins are cached in process for this many seconds (at most this many of them),
+# changes to a token or user made in another process are picked up when they expire
+AUTHENTICATION_CACHE_TTL = 300
+AUTHENTICATION_CACHE_SIZE = 10000
+
+# add 'dependencynetwork.instrumentation.ServerTimingMiddleware' to MIDDLEWARE to get Server-Timing headers and
+# timing log lines per request, requests with more queries than this log their query texts too
+SERVER_TIMING_QUERY_LOG_THRESHOLD = 50
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class DependencynetworkConfig(AppConfig):
+    name = 'dependencynetwork'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,35 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+from dependencynetwork.cache import credentials_cache, token_cache
+
+
+# TokenAuthentication without the token + user query on every request: validated tokens are kept for
+# AUTHENTICATION_CACHE_TTL seconds. deleting a token or saving its user drops it from the cache of this process,
+# other processes notice within the ttl
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        authenticated = token_cache.get(key)
+        if authenticated is None:
+            authenticated = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            token_cache.set(key, authenticated)
+        return authenticated
+
+
+# BasicAuthentication without hashing the password on every request: successful logins are kept by an hmac of the
+# credentials (never the password itself) for AUTHENTICATION_CACHE_TTL seconds. saving the user (a new password,
+# deactivation...) drops them from the cache of this process, other processes notice within the ttl
+class CachedBasicAuthentication(BasicAuthentication):
+
+    def authenticate_credentials(self, userid, password, request=None):
+        digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), ('%s\0%s' % (userid, password)).encode('utf-8'),
+                          hashlib.sha256).hexdigest()
+        authenticated = credentials_cache.get(digest)
+        if authenticated is None:
+            authenticated = super(CachedBasicAuthentication, self).authenticate_credentials(userid, password, request)
+            credentials_cache.set(digest, authenticated)
+        return authenticated
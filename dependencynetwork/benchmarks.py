@@ -0,0 +1,214 @@
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from dependencynetwork.cache import graph_cache, reachability_cache, response_cache
+from dependencynetwork.models import *
+from dependencynetwork.utils import import_network, load_dependency_graph
+
+BENCHMARK_SIZES = (1000, 10000)
+# the nested layout repeats a subtree for every path that reaches it, which grows exponentially with the depth of a
+# layered network. it is only benchmarked on networks up to this size, the flat layout on all of them
+NESTED_BENCHMARK_LIMIT = 100
+# median latencies may get this much slower than the baseline before they count as a regression (the 95th percentile
+# of a few runs is too noisy to compare). query counts may not grow at all
+BENCHMARK_TOLERANCE = 0.5
+
+
+# task names may only contain letters and spaces, so numbers are spelled in base 26: 0 -> a, 26 -> ba...
+def spell(number):
+    letters = ''
+    while True:
+        number, digit = divmod(number, 26)
+        letters = chr(ord('a') + digit) + letters
+        if not number:
+            return letters
+
+
+# import payload ({'tasks': [...], 'dependencies': [...]}) of a layered dag, as a turnaround plan looks like:
+# every task depends on 1..fan_in tasks of the layer before it, no task gets more than fan_out dependents unless
+# the whole layer is full, and about `diamonds` of the tasks close a diamond (they depend on two dependents of the
+# same task). the same arguments always give the same network
+def synthetic_network(tasks, layers=None, fan_in=3, fan_out=4, diamonds=0.2, seed=0):
+    rng = random.Random(seed)
+    layers = max(1, min(tasks, layers or int(round(tasks ** 0.5))))
+    names = ['task %s' % spell(number) for number in range(tasks)]
+    sizes = [tasks // layers + (1 if layer < tasks % layers else 0) for layer in range(layers)]
+    payload = {'tasks': [], 'dependencies': []}
+    dependents = {}
+    previous_layer, layer_before_that = [], []
+    start = 0
+    for size in sizes:
+        layer = names[start:start + size]
+        start += size
+        for name in layer:
+            payload['tasks'].append({'name': name, 'description': 'synthetic task %s' % name,
+                                     'duration': rng.randint(5, 60)})
+            dependents[name] = []
+            parents = []
+            if layer_before_that and rng.random() < diamonds:
+                grandparent = rng.choice(layer_before_that)
+                if len(dependents[grandparent]) >= 2:
+                    parents = rng.sample(dependents[grandparent], 2)
+            if previous_layer and not parents:
+                candidates = [task for task in previous_layer if len(dependents[task]) < fan_out] or previous_layer
+                parents = rng.sample(candidates, min(len(candidates), rng.randint(1, fan_in)))
+            for parent in parents:
+                dependents[parent].append(name)
+                payload['dependencies'].append({'task': name, 'depends_on_task': parent})
+        previous_layer, layer_before_that = layer, previous_layer
+    return payload
+
+
+def create_synthetic_network(aircraft_type, tasks, **options):
+    dependency_network = DependencyNetwork.objects.create(aircraft_type=aircraft_type,
+                                                          description='synthetic network of %d tasks' % tasks)
+    payload = synthetic_network(tasks, **options)
+    import_network(dependency_network.id, payload['tasks'], payload['dependencies'])
+    return dependency_network
+
+
+# runs request() `repeat` times and returns the median and 95th percentile latency in milliseconds, the queries of
+# one run and the peak memory of one extra run under tracemalloc (kept out of the timings, it slows python down).
+# setup() runs before every request and is not measured
+def measure(request, repeat, setup=None):
+    latencies = []
+    queries = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request()
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError('benchmark request failed with %d: %s' % (response.status_code, response.content[:200]))
+        queries = len(captured) if queries is None else queries
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    return {'median_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+            'queries': queries, 'peak_memory_kb': round(peak / 1024.0, 1)}
+
+
+def clear_caches():
+    graph_cache.clear()
+    reachability_cache.clear()
+    response_cache.clear()
+
+
+# benchmarks the api on a synthetic network of every size, in the current database. returns
+# {'<size>/<benchmark>': {'median_ms', 'p95_ms', 'queries', 'peak_memory_kb'}}
+def run_benchmarks(sizes=BENCHMARK_SIZES, repeat=5, log=None):
+    user, _ = User.objects.get_or_create(username='benchmark')
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    # authenticates once, so the token lookup is cached before anything is measured
+    client.get(reverse('get_create_dependency_networks'))
+    results = {}
+    for size in sizes:
+        aircraft_type = 'Synthetic %d' % size
+        dependency_network = create_synthetic_network(aircraft_type, size)
+        graph = load_dependency_graph(dependency_network.id)
+        first, last = graph.names[0], graph.names[-1]
+        # get_task renders every task downstream of the task, nested. one of the layer before the leaves keeps
+        # that small whatever the size of the network
+        before_leaves = max(node for node in range(len(graph)) if graph.dependents(node) and
+                            not any(graph.dependents(dependent) for dependent in graph.dependents(node)))
+        network_url = reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': aircraft_type})
+        levels_url = reverse('get_dependency_network_levels', kwargs={'aircraft_type': aircraft_type})
+        task_url = reverse('get_delete_update_task', kwargs={'aircraft_type': aircraft_type,
+                                                             'name': graph.names[before_leaves]})
+        dependency_url = reverse('create_delete_dependency', kwargs={'aircraft_type': aircraft_type})
+        created = iter(range(10 ** 6))
+
+        def create_tasks():
+            task = {'dependency_network_id': dependency_network.id, 'description': 'benchmark task',
+                    'name': 'benchmark task %s' % spell(next(created))}
+            return client.post(reverse('create_batch_tasks'), data=json.dumps({
+                'task': task,
+                'dependencies': [{'dependency_network_id': dependency_network.id, 'name': first, 'description': ''}],
+                'dependents': [{'dependency_network_id': dependency_network.id, 'name': last, 'description': ''}],
+            }), content_type='application/json')
+
+        # the last task can always depend on the first one. creating and deleting that dependency are measured
+        # separately, the setup of each one puts the network back with the orm
+        payload = json.dumps({'task': last, 'depends_on_task': first})
+        first_id, last_id = graph.ids[0], graph.ids[-1]
+
+        def create_dependency():
+            return client.post(dependency_url, data=payload, content_type='application/json')
+
+        def delete_dependency():
+            return client.delete(dependency_url, data=payload, content_type='application/json')
+
+        def without_dependency():
+            Dependency.objects.filter(task_id=last_id, depends_on_task_id=first_id).delete()
+
+        def with_dependency():
+            Dependency.objects.get_or_create(task_id=last_id, depends_on_task_id=first_id)
+
+        def clone():
+            return client.post(reverse('clone_dependency_network', kwargs={'aircraft_type': aircraft_type}),
+                               data=json.dumps({'aircraft_type': 'Clone %d %d' % (size, next(created))}),
+                               content_type='application/json')
+
+        benchmarks = [
+            ('get_dependency_network flat cold', lambda: client.get(network_url, {'layout': 'flat'}), clear_caches),
+            ('get_dependency_network flat', lambda: client.get(network_url, {'layout': 'flat'}), None),
+            ('get_task', lambda: client.get(task_url), None),
+            ('get_dependency_network_levels cold', lambda: client.get(levels_url), clear_caches),
+            ('get_dependency_network_levels', lambda: client.get(levels_url), None),
+            ('create_tasks', create_tasks, None),
+            ('create_dependency', create_dependency, without_dependency),
+            ('delete_dependency', delete_dependency, with_dependency),
+            ('clone', clone, None),
+        ]
+        if size <= NESTED_BENCHMARK_LIMIT:
+            benchmarks[:0] = [('get_dependency_network cold', lambda: client.get(network_url), clear_caches),
+                              ('get_dependency_network', lambda: client.get(network_url), None)]
+        for name, request, setup in benchmarks:
+            key = '%d/%s' % (size, name)
+            results[key] = measure(request, repeat, setup)
+            if log:
+                log('%-45s %s' % (key, results[key]))
+    return results
+
+
+def benchmark_environment():
+    return {'python': platform.python_version(), 'django': django.get_version(), 'machine': platform.machine(),
+            'database': connection.vendor}
+
+
+# regressions of results against a baseline, as human readable lines. benchmarks missing on either side are ignored
+def compare_benchmarks(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    regressions = []
+    for key, result in sorted(results.items()):
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append('%s: %d queries instead of %d' % (key, result['queries'], expected['queries']))
+        if result['median_ms'] > expected['median_ms'] * (1 + tolerance):
+            regressions.append('%s: median %.3fms instead of %.3fms' % (key, result['median_ms'],
+                                                                       expected['median_ms']))
+    return regressions
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# in-process LRU cache of values computed from a dependency network, e.g. loaded graphs or rendered responses.
+# an entry is only served for the network version it was computed at, so writes from any process invalidate it.
+# the memory cap is expressed in whatever unit the callers pass as entry size (tasks + dependencies, bytes...).
+class VersionedCache(object):
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value, size):
+        with self.lock:
+            entry = self.entries.get(key)
+            # a slow reader must not replace a value that was already computed at a newer version
+            if entry is not None and entry[0] > version:
+                return
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self.entries[key] = (version, value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def invalidate(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+# in-process LRU cache whose entries expire `ttl` seconds after they were set, for values that can go stale without
+# a version to check them against (authenticated users...). holds at most max_entries entries
+class ExpiringCache(object):
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # drops every entry whose value matches
+    def invalidate(self, matches):
+        with self.lock:
+            for key in [key for key, (_, value) in self.entries.items() if matches(value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# keyed by dependency network id, sized in tasks + dependencies
+graph_cache = VersionedCache(getattr(settings, 'DEPENDENCY_GRAPH_CACHE_SIZE', 1000000))
+# keyed by (dependency network id, layout), sized in bytes
+response_cache = VersionedCache(getattr(settings, 'DEPENDENCY_NETWORK_RESPONSE_CACHE_SIZE', 100 * 1024 * 1024))
+# reachability indexes by dependency network id, sized in bytes. they grow with the square of the network size, so
+# they are not kept with the graph where the graph cache would not see their size
+reachability_cache = VersionedCache(getattr(settings, 'REACHABILITY_CACHE_SIZE', 100 * 1024 * 1024))
+# authenticated (user, token) by token key, and authenticated users by a digest of their basic auth credentials
+token_cache = ExpiringCache(getattr(settings, 'AUTHENTICATION_CACHE_TTL', 300),
+                            getattr(settings, 'AUTHENTICATION_CACHE_SIZE', 10000))
+credentials_cache = ExpiringCache(getattr(settings, 'AUTHENTICATION_CACHE_TTL', 300),
+                                  getattr(settings, 'AUTHENTICATION_CACHE_SIZE', 10000))
@@ -0,0 +1,14 @@
+from django.db import OperationalError
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as rest_framework_exception_handler
+
+
+# writes lock the network row with select_for_update(), which makes writers of one network wait for each other on
+# postgresql and mysql. sqlite has no row locks: it locks the whole database and a writer that can't get the lock in
+# time fails with "database is locked". that is answered with a 503 the client can retry instead of a 500
+def exception_handler(exc, context):
+    if isinstance(exc, OperationalError):
+        return Response({'detail': 'The database is busy, try again.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={'Retry-After': '1'})
+    return rest_framework_exception_handler(exc, context)
@@ -0,0 +1,94 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('dependencynetwork.timing')
+
+current = threading.local()
+
+
+# what one request spent its time on: sql queries (text and milliseconds) and named phases in milliseconds
+class RequestTimings(object):
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.queries = []
+
+    def add(self, phase, milliseconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + milliseconds
+
+    # connection.execute_wrapper hook, sees every query of the request without DEBUG
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000))
+
+    @property
+    def sql_milliseconds(self):
+        return sum(milliseconds for _, milliseconds in self.queries)
+
+
+# times the block as a phase of the current request. does nothing unless ServerTimingMiddleware is installed
+@contextmanager
+def timed(phase):
+    timings = getattr(current, 'timings', None)
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, (time.perf_counter() - started) * 1000)
+
+
+# opt-in (add it to MIDDLEWARE): every response gets a Server-Timing header with the sql query count and time and
+# the phases timed with `timed` (graph, serialize, render), and one json line is logged to dependencynetwork.timing.
+# requests with more than SERVER_TIMING_QUERY_LOG_THRESHOLD queries log their query texts too, to spot n+1 queries.
+# the body of a streaming response is produced after the middleware returns, its queries are not counted
+class ServerTimingMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_log_threshold = getattr(settings, 'SERVER_TIMING_QUERY_LOG_THRESHOLD', 50)
+
+    def __call__(self, request):
+        timings = current.timings = RequestTimings()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.record_query):
+                response = self.get_response(request)
+        finally:
+            current.timings = None
+        total = (time.perf_counter() - started) * 1000
+
+        metrics = ['sql;dur=%.2f;desc="%d queries"' % (timings.sql_milliseconds, len(timings.queries))]
+        metrics.extend('%s;dur=%.2f' % phase for phase in timings.phases.items())
+        metrics.append('total;dur=%.2f' % total)
+        response['Server-Timing'] = ', '.join(metrics)
+
+        record = OrderedDict([('method', request.method), ('path', request.path), ('status', response.status_code),
+                              ('total_ms', round(total, 2)), ('sql_queries', len(timings.queries)),
+                              ('sql_ms', round(timings.sql_milliseconds, 2))])
+        record.update(('%s_ms' % phase, round(milliseconds, 2)) for phase, milliseconds in timings.phases.items())
+        if len(timings.queries) > self.query_log_threshold:
+            record['queries'] = [sql for sql, _ in timings.queries]
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+    # drf responses are rendered after the view returns, right after this hook
+    def process_template_response(self, request, response):
+        timings = current.timings
+        started = time.perf_counter()
+        response.add_post_render_callback(lambda _: timings.add('render', (time.perf_counter() - started) * 1000))
+        return response
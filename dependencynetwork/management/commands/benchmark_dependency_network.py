@@ -0,0 +1,55 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from dependencynetwork.benchmarks import BENCHMARK_SIZES, BENCHMARK_TOLERANCE, benchmark_environment, \
+    compare_benchmarks, run_benchmarks
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmark_baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the api on synthetic networks in a throwaway test database and compares the results ' \
+           'with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES),
+                            help='number of tasks of every synthetic network (up to 100000)')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='write the results as json to this file')
+        parser.add_argument('--baseline', default=BASELINE_PATH,
+                            help='results to compare with, the stored baseline by default')
+        parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE)
+        parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+
+    def handle(self, *args, **options):
+        if any(size < 2 or size > 100000 for size in options['sizes']):
+            raise CommandError('sizes must be between 2 and 100000 tasks')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(options['sizes'], options['repeat'], log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {'environment': benchmark_environment(), 'results': results}
+        for path in filter(None, (options['output'], options['save_baseline'] and options['baseline'])):
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+            self.stdout.write('wrote %s' % path)
+        if options['save_baseline'] or not os.path.exists(options['baseline']):
+            return
+
+        with open(options['baseline']) as file:
+            baseline = json.load(file)
+        if baseline['environment'] != report['environment']:
+            self.stdout.write('the baseline was recorded in a different environment: %s' % baseline['environment'])
+        regressions = compare_benchmarks(results, baseline['results'], options['tolerance'])
+        if regressions:
+            raise CommandError('slower than %s:\n%s' % (options['baseline'], '\n'.join(regressions)))
+        self.stdout.write('no regressions against %s' % options['baseline'])
@@ -0,0 +1,30 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dependencynetwork.models import DependencyNetwork
+from dependencynetwork.snapshot import write_snapshot
+from dependencynetwork.utils import load_dependency_graph
+
+
+class Command(BaseCommand):
+    help = 'Writes the binary snapshot of a dependency network, for workers that open it with ' \
+           'dependencynetwork.snapshot.DependencyNetworkSnapshot.open'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aircraft_type')
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        try:
+            dependency_network = DependencyNetwork.objects.get(aircraft_type=options['aircraft_type'])
+        except DependencyNetwork.DoesNotExist:
+            raise CommandError('dependency network %r does not exist' % options['aircraft_type'])
+
+        # written next to the target and renamed over it, workers that have the old file mapped keep reading it
+        temporary_path = '%s.%d.tmp' % (options['path'], os.getpid())
+        with open(temporary_path, 'wb') as file:
+            write_snapshot(load_dependency_graph(dependency_network.id), dependency_network, file)
+        os.replace(temporary_path, options['path'])
+        self.stdout.write('wrote version %d of %s to %s' % (dependency_network.version,
+                                                            dependency_network.aircraft_type, options['path']))
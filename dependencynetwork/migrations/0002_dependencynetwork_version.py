@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dependencynetwork', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dependencynetwork',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:46
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+# tasks with the same name in one network are merged into the one with the lowest id: the dependencies of the others
+# are moved to it before they are deleted
+def merge_duplicate_tasks(apps, schema_editor):
+    Task = apps.get_model('dependencynetwork', 'Task')
+    Dependency = apps.get_model('dependencynetwork', 'Dependency')
+    duplicates = Task.objects.values('dependency_network_id', 'name') \
+        .annotate(kept_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        kept_id = duplicate['kept_id']
+        merged_ids = list(Task.objects.filter(dependency_network_id=duplicate['dependency_network_id'],
+                                              name=duplicate['name']).exclude(id=kept_id)
+                          .values_list('id', flat=True))
+        Dependency.objects.filter(task_id__in=merged_ids).update(task_id=kept_id)
+        Dependency.objects.filter(depends_on_task_id__in=merged_ids).update(depends_on_task_id=kept_id)
+        Task.objects.filter(id__in=merged_ids).delete()
+        # a task that depended on its own duplicate now depends on itself
+        Dependency.objects.filter(task_id=kept_id, depends_on_task_id=kept_id).delete()
+
+
+def remove_duplicate_dependencies(apps, schema_editor):
+    Dependency = apps.get_model('dependencynetwork', 'Dependency')
+    kept_ids = Dependency.objects.values('task_id', 'depends_on_task_id').annotate(id=Min('id')).values('id')
+    Dependency.objects.exclude(id__in=kept_ids).delete()
+
+
+# the cleanup runs in a migration (a transaction) of its own: postgresql doesn't alter a table with deferred foreign
+# key checks of the deletes still pending
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dependencynetwork', '0002_dependencynetwork_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tasks, migrations.RunPython.noop),
+        migrations.RunPython(remove_duplicate_dependencies, migrations.RunPython.noop),
+    ]
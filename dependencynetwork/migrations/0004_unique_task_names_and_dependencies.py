@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dependencynetwork', '0003_merge_duplicate_tasks_and_dependencies'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dependency',
+            unique_together={('task', 'depends_on_task')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='task',
+            unique_together={('dependency_network', 'name')},
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:52
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dependencynetwork', '0004_unique_task_names_and_dependencies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dependencynetwork',
+            name='ground_time',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='duration',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='earliest_start',
+            field=models.CharField(blank=True, default='', max_length=10, validators=[django.core.validators.RegexValidator('^(?P<reference>[AD])(?P<offset>[+-]\\d+)$', 'Enter a time relative to arrival or departure, i.e. A+5 or D-45.')]),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='latest_end',
+            field=models.CharField(blank=True, default='', max_length=10, validators=[django.core.validators.RegexValidator('^(?P<reference>[AD])(?P<offset>[+-]\\d+)$', 'Enter a time relative to arrival or departure, i.e. A+5 or D-45.')]),
+        ),
+    ]
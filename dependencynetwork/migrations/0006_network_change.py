@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dependencynetwork', '0005_task_timing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkChange',
+            fields=[
+                ('id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField()),
+                ('kind', models.CharField(max_length=10)),
+                ('action', models.CharField(max_length=6)),
+                ('data', models.TextField()),
+                ('dependency_network', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='dependencynetwork.DependencyNetwork')),
+            ],
+            options={
+                'index_together': {('dependency_network', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:51
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dependencynetwork', '0006_network_change'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='earliest_start',
+            field=models.CharField(blank=True, default='', max_length=10, validators=[django.core.validators.RegexValidator('^(?P<reference>[AD])(?P<offset>[+-]\\d+)\\Z', 'Enter a time relative to arrival or departure, i.e. A+5 or D-45.')]),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='latest_end',
+            field=models.CharField(blank=True, default='', max_length=10, validators=[django.core.validators.RegexValidator('^(?P<reference>[AD])(?P<offset>[+-]\\d+)\\Z', 'Enter a time relative to arrival or departure, i.e. A+5 or D-45.')]),
+        ),
+    ]
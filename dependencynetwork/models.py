@@ -1,11 +1,27 @@
+from django.core.validators import RegexValidator
 from django.db import models
 from rest_framework_recursive.fields import RecursiveField
 
+# times as written in the GOMS: minutes after the arrival (A+5) or minutes until the departure (D-45) of the aircraft
+TIME_PATTERN = r'^(?P<reference>[AD])(?P<offset>[+-]\d+)\Z'
+TIMING_FIELDS = ('earliest_start', 'duration', 'latest_end')
+time_validator = RegexValidator(TIME_PATTERN, 'Enter a time relative to arrival or departure, i.e. A+5 or D-45.')
+
 
 class DependencyNetwork(models.Model):
     id = models.AutoField(primary_key=True, editable=False)
     aircraft_type = models.CharField(unique=True, db_index=True, null=False, blank=False, max_length=20)
     description = models.CharField(max_length=200)
+    # bumped on every task/dependency write of this network (see signals.py), used to invalidate cached graphs
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # minutes between arrival and departure, needed to schedule tasks with D-n times
+    ground_time = models.PositiveIntegerField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        # never write a possibly stale version back, it is only ever incremented in the db
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = ('aircraft_type', 'description', 'ground_time')
+        super(DependencyNetwork, self).save(*args, **kwargs)
 
 
 class Task(models.Model):
@@ -13,11 +29,38 @@ class Task(models.Model):
     dependency_network = models.ForeignKey(DependencyNetwork, on_delete=models.CASCADE, null=False)
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=200)
+    earliest_start = models.CharField(max_length=10, blank=True, default='', validators=[time_validator])
+    duration = models.PositiveIntegerField(default=0)
+    latest_end = models.CharField(max_length=10, blank=True, default='', validators=[time_validator])
     dependencies = RecursiveField(allow_null=True, allow_empty=True, many=True)
     dependents = RecursiveField(allow_null=True, allow_empty=True, many=True)
 
+    class Meta:
+        unique_together = ('dependency_network', 'name')
+
 
 class Dependency(models.Model):
     id = models.AutoField(primary_key=True, editable=False)
     task = models.ForeignKey(Task, on_delete=models.CASCADE, null=False, related_name="task")
-    depends_on_task = models.ForeignKey(Task, on_delete=models.CASCADE, null=False, related_name="depends_on_task")
\ No newline at end of file
+    depends_on_task = models.ForeignKey(Task, on_delete=models.CASCADE, null=False, related_name="depends_on_task")
+
+    class Meta:
+        unique_together = ('task', 'depends_on_task')
+
+
+# change log of the tasks and dependencies of a network for incremental sync: every write is recorded with the version
+# of the network it produced (see signals.py). changes written together (batch edits, imports) share a version
+class NetworkChange(models.Model):
+    id = models.AutoField(primary_key=True, editable=False)
+    dependency_network = models.ForeignKey(DependencyNetwork, on_delete=models.CASCADE, null=False,
+                                           related_name='changes')
+    version = models.PositiveIntegerField()
+    # 'task' or 'dependency'
+    kind = models.CharField(max_length=10)
+    # 'create', 'update' or 'delete'
+    action = models.CharField(max_length=6)
+    # json: all fields of a created/updated task, the id of a deleted task, task and depends_on_task ids of a dependency
+    data = models.TextField()
+
+    class Meta:
+        index_together = ('dependency_network', 'version')
@@ -0,0 +1,23 @@
+import pickle
+
+import django
+from django.db import connections
+
+# the schedule arrays of the batch this worker process was started for, see evaluate_scenarios
+arrays = None
+
+
+# runs first in every worker process of a batch. workers are spawned, not forked from a request process with its
+# database connections and held locks, so they set django up themselves. the arrays arrive pickled because loading
+# them imports the models, which needs django to be set up first
+def init_worker(pickled_arrays):
+    global arrays
+    django.setup()
+    connections.close_all()
+    arrays = pickle.loads(pickled_arrays)
+
+
+def evaluate_chunk(columns, ground_time, durations):
+    # imported here, the module can only be loaded after init_worker
+    from dependencynetwork.scheduling import evaluate_scenario_chunk
+    return evaluate_scenario_chunk(arrays, columns, ground_time, durations)
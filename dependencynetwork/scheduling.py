@@ -0,0 +1,237 @@
+import heapq
+import multiprocessing
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+
+from dependencynetwork import schedule_workers
+from dependencynetwork.models import TIME_PATTERN
+from dependencynetwork.utils import topological_order
+
+
+# a dependency network as numpy arrays in topological order, built once per cached graph version.
+# edges are grouped by the level (longest distance from a root) of their dependent task for the forward pass and
+# of the task they depend on for the backward pass, so each pass is one vectorized step per level of the network
+class ScheduleArrays(object):
+
+    def __init__(self, graph):
+        order = topological_order(graph)
+        if order is None:
+            raise ValueError('dependency network has a cycle')
+        # order[position] is the node of the graph at that position, positions[node] its position
+        self.order = np.array(order, dtype=np.int64)
+        self.positions = positions = np.empty(len(order), dtype=np.int64)
+        positions[self.order] = np.arange(len(order))
+        self.durations = np.array(graph.durations, dtype=np.float64)[self.order]
+        self.earliest_starts = self.parse_times(graph.earliest_starts)
+        self.latest_ends = self.parse_times(graph.latest_ends)
+
+        levels = np.zeros(len(order), dtype=np.int64)
+        for position, node in enumerate(order):
+            for dependency in graph.dependencies(node):
+                levels[position] = max(levels[position], levels[positions[dependency]] + 1)
+        parents = positions[np.array(graph.edge_depends_on, dtype=np.int64)]
+        children = positions[np.array(graph.edge_tasks, dtype=np.int64)]
+        self.forward_steps = self.group(levels[children], children, parents, reverse=False)
+        self.backward_steps = self.group(levels[parents], parents, children, reverse=True)
+
+    # per position: the offset in minutes, whether it is relative to departure and whether the time is set at all
+    def parse_times(self, times):
+        offsets = np.zeros(len(self.order), dtype=np.float64)
+        from_departure = np.zeros(len(self.order), dtype=bool)
+        is_set = np.zeros(len(self.order), dtype=bool)
+        for position, node in enumerate(self.order.tolist()):
+            match = re.match(TIME_PATTERN, times[node])
+            if match:
+                offsets[position] = int(match.group('offset'))
+                from_departure[position] = match.group('reference') == 'D'
+                is_set[position] = True
+        return offsets, from_departure, is_set
+
+    # one (targets, sources, segment starts) step per level: every target gets reduced over its run of sources
+    @staticmethod
+    def group(edge_levels, targets, sources, reverse):
+        steps = []
+        for level in sorted(set(edge_levels.tolist()), reverse=reverse):
+            in_level = edge_levels == level
+            order = np.argsort(targets[in_level], kind='stable')
+            level_targets, level_sources = targets[in_level][order], sources[in_level][order]
+            unique_targets, starts = np.unique(level_targets, return_index=True)
+            steps.append((unique_targets, level_sources, starts))
+        return steps
+
+    @property
+    def needs_ground_time(self):
+        return bool((self.earliest_starts[1] & self.earliest_starts[2]).any() or
+                    (self.latest_ends[1] & self.latest_ends[2]).any())
+
+    # minutes since arrival, default where the time is not set
+    def resolve_times(self, times, ground_time, default):
+        offsets, from_departure, is_set = times
+        resolved = np.where(from_departure, (ground_time or 0) + offsets, offsets)
+        return np.where(is_set, resolved, default)
+
+    # forward and backward pass for a (scenarios x tasks) matrix of durations, all times in minutes since arrival.
+    # without a ground time the latest finish of every task is bound by the completion time of its scenario.
+    # internally the matrices are (tasks x scenarios), so gathering the tasks of a step reads contiguous rows
+    def schedule(self, durations, ground_time=None):
+        if ground_time is None and self.needs_ground_time:
+            raise ValueError('ground_time is required to schedule tasks with times relative to departure')
+        durations = np.ascontiguousarray(durations.T)
+        scenarios = durations.shape[1]
+        earliest_starts = np.repeat(self.resolve_times(self.earliest_starts, ground_time, 0)[:, np.newaxis],
+                                    scenarios, axis=1)
+        for targets, sources, starts in self.forward_steps:
+            finishes = earliest_starts[sources] + durations[sources]
+            earliest_starts[targets] = np.maximum(earliest_starts[targets], np.maximum.reduceat(finishes, starts))
+        earliest_finishes = earliest_starts + durations
+        completion_times = earliest_finishes.max(axis=0, initial=0)
+
+        deadlines = completion_times if ground_time is None else np.full(scenarios, float(ground_time))
+        latest_ends = self.resolve_times(self.latest_ends, ground_time, np.inf)
+        latest_finishes = np.minimum(latest_ends[:, np.newaxis], deadlines[np.newaxis, :])
+        for targets, sources, starts in self.backward_steps:
+            starts_of_sources = latest_finishes[sources] - durations[sources]
+            latest_finishes[targets] = np.minimum(latest_finishes[targets],
+                                                  np.minimum.reduceat(starts_of_sources, starts))
+        latest_starts = latest_finishes - durations
+        slacks = latest_starts - earliest_starts
+        # critical tasks have the least slack of their scenario (zero, unless deadlines can't be met or are loose)
+        critical = np.isclose(slacks, slacks.min(axis=0, initial=np.inf, keepdims=True))
+        return {'earliest_start': earliest_starts.T, 'earliest_finish': earliest_finishes.T,
+                'latest_start': latest_starts.T, 'latest_finish': latest_finishes.T, 'slack': slacks.T,
+                'critical': critical.T, 'completion_time': completion_times}
+
+
+def get_schedule_arrays(graph):
+    return graph.get_derived('schedule_arrays', ScheduleArrays)
+
+
+# schedule of the network with the task durations stored in the db, as arrays over the tasks in topological order
+def compute_baseline_schedule(graph, ground_time=None):
+    arrays = get_schedule_arrays(graph)
+    result = arrays.schedule(arrays.durations[np.newaxis, :], ground_time)
+    return {key: value[0] for key, value in result.items()}
+
+
+def compute_schedule(graph, ground_time=None):
+    return format_schedule(graph, compute_baseline_schedule(graph, ground_time))
+
+
+def format_schedule(graph, baseline):
+    order = get_schedule_arrays(graph).order.tolist()
+    columns = ('earliest_start', 'earliest_finish', 'latest_start', 'latest_finish', 'slack')
+    rows = zip(order, zip(*(baseline[column].tolist() for column in columns)))
+    return {
+        'completion_time': float(baseline['completion_time']),
+        'critical_path': [graph.names[node] for node, critical in zip(order, baseline['critical']) if critical],
+        'tasks': [dict({'id': graph.ids[node], 'name': graph.names[node]}, **dict(zip(columns, values)))
+                  for node, values in rows],
+    }
+
+
+baseline_schedules_lock = threading.Lock()
+
+
+# the baseline schedules of the SCHEDULE_BASELINE_CACHE_SIZE ground times asked for most recently are cached until
+# the network changes. no ground time means the one of the network
+def get_baseline_schedule(graph, dependency_network, ground_time=None):
+    if ground_time is None:
+        ground_time = dependency_network.ground_time
+    schedules = graph.get_derived('baseline_schedules', lambda g: OrderedDict())
+    with baseline_schedules_lock:
+        baseline = schedules.get(ground_time)
+        if baseline is not None:
+            schedules.move_to_end(ground_time)
+            return baseline
+    baseline = compute_baseline_schedule(graph, ground_time)
+    with baseline_schedules_lock:
+        schedules[ground_time] = baseline
+        while len(schedules) > getattr(settings, 'SCHEDULE_BASELINE_CACHE_SIZE', 8):
+            schedules.popitem(last=False)
+    return baseline
+
+
+def get_schedule(graph, dependency_network, ground_time=None):
+    if ground_time is None or ground_time == dependency_network.ground_time:
+        return graph.get_derived(('schedule', dependency_network.ground_time),
+                                 lambda g: format_schedule(g, get_baseline_schedule(g, dependency_network)))
+    return format_schedule(graph, get_baseline_schedule(graph, dependency_network, ground_time))
+
+
+# what happens to the schedule if task starts `delay` minutes late. the delay is pushed down the dependents of the
+# task in topological order, every dependent absorbs as much of it as its own earliest start allows, and the walk
+# stops where nothing is left. only the tasks that actually move are visited, the baseline schedule is cached.
+# without a ground time there is no departure to be at risk: late only means the task now ends after its latest end
+# or pushes out the completion time
+def propagate_delay(graph, dependency_network, task, delay, ground_time=None):
+    if ground_time is None:
+        ground_time = dependency_network.ground_time
+    positions = get_schedule_arrays(graph).positions
+    baseline = get_baseline_schedule(graph, dependency_network, ground_time)
+    earliest_starts = baseline['earliest_start']
+    earliest_finishes = baseline['earliest_finish']
+    latest_finishes = baseline['latest_finish']
+    delays = {task.node: delay}
+    queue = [(positions[task.node], task.node)]
+    changed_tasks = []
+    completion_time = float(baseline['completion_time'])
+    while queue:
+        position, node = heapq.heappop(queue)
+        task_delay = delays[node]
+        finish = earliest_finishes[position] + task_delay
+        completion_time = max(completion_time, finish)
+        changed_tasks.append({'id': graph.ids[node], 'name': graph.names[node],
+                              'earliest_start': float(earliest_starts[position] + task_delay),
+                              'earliest_finish': float(finish), 'delay': float(task_delay),
+                              'late': bool(finish > latest_finishes[position])})
+        for dependent in graph.dependents(node):
+            dependent_position = positions[dependent]
+            dependent_delay = finish - earliest_starts[dependent_position]
+            if dependent_delay > delays.get(dependent, 0):
+                if dependent not in delays:
+                    heapq.heappush(queue, (dependent_position, dependent))
+                delays[dependent] = dependent_delay
+    return {'task': task.name, 'delay': delay, 'completion_time': completion_time,
+            'departure_at_risk': None if ground_time is None else any(changed_task['late']
+                                                                      for changed_task in changed_tasks),
+            'changed_tasks': changed_tasks}
+
+
+def evaluate_scenario_chunk(arrays, columns, ground_time, durations):
+    matrix = np.tile(arrays.durations, (len(durations), 1))
+    matrix[:, columns] = durations
+    result = arrays.schedule(matrix, ground_time)
+    return result['completion_time'], result['critical']
+
+
+# completion time and critical tasks of the network for every row of a (scenarios x len(task_names)) matrix of
+# durations, tasks that are not listed keep their own duration. scenarios are evaluated in chunks to bound the
+# size of the intermediate matrices, and spread over SCHEDULE_BATCH_WORKERS spawned processes when it is set. the
+# workers are started per batch and get the arrays once, when they start, only the chunks are sent per task
+def evaluate_scenarios(graph, task_names, durations, ground_time=None):
+    arrays = get_schedule_arrays(graph)
+    columns = [arrays.positions[graph.get_task(name).node] for name in task_names]
+    chunk_size = getattr(settings, 'SCHEDULE_BATCH_CHUNK_SIZE', 1000)
+    chunks = [durations[start:start + chunk_size] for start in range(0, len(durations), chunk_size)]
+    workers = getattr(settings, 'SCHEDULE_BATCH_WORKERS', 0)
+    if workers and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=schedule_workers.init_worker,
+                                 initargs=(pickle.dumps(arrays),)) as process_pool:
+            results = list(process_pool.map(partial(schedule_workers.evaluate_chunk, columns, ground_time), chunks))
+    else:
+        results = [evaluate_scenario_chunk(arrays, columns, ground_time, chunk) for chunk in chunks]
+    completion_times, critical_tasks = [], []
+    for chunk_completion_times, chunk_critical in results:
+        completion_times.extend(chunk_completion_times.tolist())
+        critical_tasks.extend([graph.names[node] for node in arrays.order[np.flatnonzero(row)].tolist()]
+                              for row in chunk_critical)
+    return {'completion_times': completion_times, 'critical_tasks': critical_tasks}
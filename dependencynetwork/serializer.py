@@ -6,7 +6,7 @@ from .models import *
 class DependencyNetworkSerializer(serializers.ModelSerializer):
     class Meta:
         model = DependencyNetwork
-        fields = ('id', 'aircraft_type', 'description')
+        fields = ('id', 'aircraft_type', 'description', 'ground_time')
 
 
 class TaskSerializer(serializers.ModelSerializer):
@@ -14,7 +14,7 @@ class TaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = ('id', 'name', 'description', 'dependents')
+        fields = ('id', 'name', 'description', 'earliest_start', 'duration', 'latest_end', 'dependents')
 
     def create(self, validated_data):
         if not validated_data.get('dependency_network_id'):
@@ -23,6 +23,25 @@ class TaskSerializer(serializers.ModelSerializer):
         return super(TaskSerializer, self).create(validated_data)
 
 
+class FlatTaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Task
+        fields = ('id', 'name', 'description', 'earliest_start', 'duration', 'latest_end')
+
+
+# every task and every edge exactly once, instead of re-expanding shared subtrees per path
+class FlatDependencyNetworkSerializer(serializers.Serializer):
+    tasks = serializers.SerializerMethodField()
+    dependencies = serializers.SerializerMethodField()
+
+    def get_tasks(self, graph):
+        return FlatTaskSerializer(graph.tasks(), many=True).data
+
+    def get_dependencies(self, graph):
+        return [{'task': task_id, 'depends_on_task': depends_on_task_id}
+                for task_id, depends_on_task_id in graph.edges()]
+
+
 class DependencySerializer(serializers.ModelSerializer):
     class Meta:
         model = Dependency
@@ -0,0 +1,112 @@
+import json
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .cache import credentials_cache, graph_cache, reachability_cache, token_cache
+from .models import *
+
+
+# bumps the version of the network and records the changes that produced it, (kind, action, data) tuples
+def bump_version(dependency_network_id, changes=()):
+    with transaction.atomic():
+        DependencyNetwork.objects.filter(id=dependency_network_id).update(version=F('version') + 1)
+        if changes:
+            version = DependencyNetwork.objects.filter(id=dependency_network_id).values_list('version', flat=True) \
+                .first()
+            NetworkChange.objects.bulk_create(NetworkChange(dependency_network_id=dependency_network_id,
+                                                            version=version, kind=kind, action=action,
+                                                            data=json.dumps(data))
+                                              for kind, action, data in changes)
+    graph_cache.invalidate(dependency_network_id)
+    reachability_cache.invalidate(dependency_network_id)
+
+
+deferred = threading.local()
+
+
+# for bulk edits of one network: inside the block task and dependency changes are only collected, the version is
+# bumped once at the end with all of them. every change made inside must belong to dependency_network_id, and
+# writes that send no signals (bulk_create, bulk_update...) have to be passed to record_change by hand
+@contextmanager
+def deferred_version_bump(dependency_network_id):
+    deferred.dependency_network_id = dependency_network_id
+    deferred.changes = []
+    try:
+        yield
+        changes = deferred.changes
+    finally:
+        deferred.dependency_network_id = None
+        deferred.changes = None
+    bump_version(dependency_network_id, changes)
+
+
+suppressed = threading.local()
+
+
+# for deleting a network: its tasks and dependencies are deleted with it and there is no one left to sync their
+# changes to, so none are recorded inside the block. like above, every change made inside must belong to
+# dependency_network_id
+@contextmanager
+def suppress_changes(dependency_network_id):
+    suppressed.dependency_network_id = dependency_network_id
+    try:
+        yield
+    finally:
+        suppressed.dependency_network_id = None
+
+
+def record_change(dependency_network_id, kind, action, data):
+    if dependency_network_id == getattr(suppressed, 'dependency_network_id', None):
+        return
+    if getattr(deferred, 'dependency_network_id', None) is not None:
+        deferred.changes.append((kind, action, data))
+    else:
+        bump_version(dependency_network_id, [(kind, action, data)])
+
+
+def task_data(task):
+    return {field: getattr(task, field) for field in ('id', 'name', 'description') + TIMING_FIELDS}
+
+
+@receiver((post_save, post_delete), sender=Task)
+def task_changed(sender, instance, created=False, **kwargs):
+    if kwargs['signal'] is post_delete:
+        record_change(instance.dependency_network_id, 'task', 'delete', {'id': instance.id})
+    else:
+        record_change(instance.dependency_network_id, 'task', 'create' if created else 'update', task_data(instance))
+
+
+@receiver((post_save, post_delete), sender=Dependency)
+def dependency_changed(sender, instance, created=False, **kwargs):
+    # the task of a suppressed delete is already on its way out, don't fetch it only to drop the change
+    if getattr(suppressed, 'dependency_network_id', None) is not None:
+        return
+    dependency_network_id = getattr(deferred, 'dependency_network_id', None) or instance.task.dependency_network_id
+    record_change(dependency_network_id, 'dependency', 'delete' if kwargs['signal'] is post_delete else 'create',
+                  {'task': instance.task_id, 'depends_on_task': instance.depends_on_task_id})
+
+
+@receiver(post_delete, sender=DependencyNetwork)
+def dependency_network_deleted(sender, instance, **kwargs):
+    graph_cache.invalidate(instance.id)
+    reachability_cache.invalidate(instance.id)
+
+
+@receiver((post_save, post_delete), sender=Token)
+def token_changed(sender, instance, **kwargs):
+    token_cache.invalidate(lambda authenticated: authenticated[1].key == instance.key)
+
+
+# a new password, deactivation... every cached login of the user has to be checked again
+@receiver((post_save, post_delete), sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    token_cache.invalidate(lambda authenticated: authenticated[0].pk == instance.pk)
+    credentials_cache.invalidate(lambda authenticated: authenticated[0].pk == instance.pk)
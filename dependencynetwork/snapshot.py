@@ -0,0 +1,175 @@
+import hashlib
+import io
+import mmap
+import struct
+import sys
+from array import array
+
+from dependencynetwork.cache import response_cache
+from dependencynetwork.utils import DependencyGraph, get_dependency_graph
+
+# binary snapshot of a dependency network, for local workers that share one page-cached copy through mmap instead
+# of each parsing the json of the network. everything is little-endian and every section starts 8-byte aligned:
+#
+#   header         magic, format version, network id, network version, ground time (-1 if not set), task count (n),
+#                  dependency count (e), size of the string data
+#   ids            int64[n]   task ids, ascending: node i of the graph is the task with the i-th smallest id
+#   durations      int64[n]
+#   dependencies   int32[n + 1] offsets, int32[e] nodes: the parents of node i (csr, same as DependencyGraph)
+#   dependents     int32[n + 1] offsets, int32[e] nodes: the children of node i
+#   edges          int32[e] task nodes, int32[e] depends on task nodes, in the order the dependencies were created
+#   strings        int64[4n + 1] offsets into the utf-8 data that follows them, one string per task for name,
+#                  description, earliest start and latest end (in that order, n strings each)
+SNAPSHOT_MAGIC = b'DEPNETSN'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sIIqqqqqq')
+SNAPSHOT_STRING_COLUMNS = ('names', 'descriptions', 'earliest_starts', 'latest_ends')
+
+
+def write_snapshot(graph, dependency_network, file):
+    strings = [value.encode('utf-8') for column in SNAPSHOT_STRING_COLUMNS for value in getattr(graph, column)]
+    string_offsets = array('q', [0])
+    for value in strings:
+        string_offsets.append(string_offsets[-1] + len(value))
+    ground_time = -1 if dependency_network.ground_time is None else dependency_network.ground_time
+    file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, 0, dependency_network.id,
+                                    dependency_network.version, ground_time, len(graph), len(graph.edge_tasks),
+                                    string_offsets[-1]))
+    for section in (array('q', graph.ids), array('q', graph.durations),
+                    graph.dependency_offsets, graph.dependency_indices,
+                    graph.dependent_offsets, graph.dependent_indices,
+                    graph.edge_tasks, graph.edge_depends_on, string_offsets):
+        if sys.byteorder != 'little':
+            section = array(section.typecode, section)
+            section.byteswap()
+        data = section.tobytes()
+        file.write(data + b'\0' * (-len(data) % 8))
+    file.write(b''.join(strings))
+
+
+def dump_snapshot(graph, dependency_network):
+    file = io.BytesIO()
+    write_snapshot(graph, dependency_network, file)
+    return file.getvalue()
+
+
+# returns the snapshot bytes of the network and their strong etag, built once per version
+def render_dependency_network_snapshot(dependency_network):
+    key = (dependency_network.id, 'snapshot')
+    rendered = response_cache.get(key, dependency_network.version)
+    if rendered is None:
+        content = dump_snapshot(get_dependency_graph(dependency_network), dependency_network)
+        rendered = (content, '"%s"' % hashlib.md5(content).hexdigest())
+        response_cache.set(key, dependency_network.version, rendered, len(content))
+    return rendered
+
+
+# one string column of a snapshot, decoded on access
+class SnapshotStrings(object):
+
+    def __init__(self, data, offsets, start, count):
+        self.data = data
+        self.offsets = offsets
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, node):
+        if not 0 <= node < self.count:
+            raise IndexError(node)
+        index = self.start + node
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        return (self[node] for node in range(self.count))
+
+
+# read-only DependencyGraph over the bytes of a snapshot. the arrays are memoryviews into the buffer, nothing is
+# copied or parsed up front, so workers that open the same file share its pages. traversals, topological order,
+# schedules... work on it like on a graph loaded from the db.
+#
+#   with DependencyNetworkSnapshot.open('boeing-777.snapshot') as graph:
+#       walk_flat(graph.get_task('ADO'), 'dependents')
+class DependencyNetworkSnapshot(DependencyGraph):
+
+    def __init__(self, buffer, path=None):
+        if sys.byteorder != 'little':
+            raise ValueError('snapshots can only be mapped on little-endian machines')
+        self.path = path
+        self.mmap = None
+        self.buffer = memoryview(buffer)
+        if len(self.buffer) < SNAPSHOT_HEADER.size:
+            raise ValueError('not a dependency network snapshot')
+        magic, format_version, _, self.dependency_network_id, self.version, ground_time, tasks, edges, string_size = \
+            SNAPSHOT_HEADER.unpack_from(self.buffer)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('not a dependency network snapshot')
+        if format_version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError('unsupported snapshot format version %d' % format_version)
+        self.ground_time = None if ground_time < 0 else ground_time
+        self.position = SNAPSHOT_HEADER.size
+        self.ids = self.section('q', tasks)
+        self.durations = self.section('q', tasks)
+        self.dependency_offsets = self.section('i', tasks + 1)
+        self.dependency_indices = self.section('i', edges)
+        self.dependent_offsets = self.section('i', tasks + 1)
+        self.dependent_indices = self.section('i', edges)
+        self.edge_tasks = self.section('i', edges)
+        self.edge_depends_on = self.section('i', edges)
+        string_offsets = self.section('q', len(SNAPSHOT_STRING_COLUMNS) * tasks + 1)
+        string_data = self.buffer[self.position:self.position + string_size]
+        if len(string_data) != string_size:
+            raise ValueError('truncated dependency network snapshot')
+        for index, column in enumerate(SNAPSHOT_STRING_COLUMNS):
+            setattr(self, column, SnapshotStrings(string_data, string_offsets, index * tasks, tasks))
+        self._nodes_by_name = None
+        self.derived = {}
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = cls(mapped, path)
+        snapshot.mmap = mapped
+        return snapshot
+
+    def section(self, typecode, count):
+        size = array(typecode).itemsize * count
+        data = self.buffer[self.position:self.position + size]
+        if len(data) != size:
+            raise ValueError('truncated dependency network snapshot')
+        self.position += size + (-size % 8)
+        return data.cast(typecode)
+
+    # only built if names are looked up
+    @property
+    def nodes_by_name(self):
+        if self._nodes_by_name is None:
+            self._nodes_by_name = {name: node for node, name in enumerate(self.names)}
+        return self._nodes_by_name
+
+    # a snapshot opened from a file travels to other processes as its path
+    def __reduce__(self):
+        if self.path is None:
+            raise TypeError('only snapshots opened from a file can be pickled')
+        return self.__class__.open, (self.path,)
+
+    def close(self):
+        self.derived = {}
+        for name in ('ids', 'durations', 'dependency_offsets', 'dependency_indices', 'dependent_offsets',
+                     'dependent_indices', 'edge_tasks', 'edge_depends_on'):
+            getattr(self, name).release()
+        for column in SNAPSHOT_STRING_COLUMNS:
+            getattr(self, column).offsets.release()
+            getattr(self, column).data.release()
+        self.buffer.release()
+        if self.mmap is not None:
+            self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,11 +1,26 @@
+import base64
+import io
+import os
+import pickle
+import tempfile
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from rest_framework.authtoken.models import Token
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.utils import json
 
-from .serializer import DependencyNetworkSerializer
+from .benchmarks import compare_benchmarks, run_benchmarks, synthetic_network
+from .cache import credentials_cache, graph_cache, reachability_cache, response_cache, token_cache
+from .exceptions import exception_handler
+from .scheduling import compute_schedule
+from .serializer import DependencyNetworkSerializer, FlatDependencyNetworkSerializer
+from .snapshot import DependencyNetworkSnapshot, dump_snapshot
+from .utils import diff_graphs, find_cycle, get_dependency_graph, walk_flat
 from .models import *
 
 
@@ -19,6 +34,12 @@ class ApiTest(APITestCase):
                                              password='F4kePaSsw0rd')
         Token.objects.create(user=self.user)
         super(ApiTest, self).setUp()
+        # every test rolls the db back to the same ids and versions, so anything cached by a previous test is stale
+        graph_cache.clear()
+        reachability_cache.clear()
+        response_cache.clear()
+        token_cache.clear()
+        credentials_cache.clear()
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.user.auth_token.key)
 
         dependency_network_1 = DependencyNetwork.objects.create(
@@ -80,7 +101,219 @@ class ApiTest(APITestCase):
             reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}))
         network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 4)
+        self.assertEqual([task['name'] for task in response.json()], ['ADO', 'security check', 'cabin check'])
+
+    def test_get_dependency_network_query_count_does_not_depend_on_size(self):
+        url = reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        # the token is looked up once, then cached
+        self.client.get(reverse('get_create_dependency_networks'))
+        with CaptureQueriesContext(connection) as small_network_queries:
+            self.client.get(url)
+        ado = Task.objects.get(dependency_network_id=1, name='ADO')
+        parent_task = ado
+        for i in range(20):
+            task = Task.objects.create(dependency_network_id=1, name='chain %d' % i, description='chain')
+            Dependency.objects.create(task=task, depends_on_task=parent_task)
+            parent_task = task
+        with CaptureQueriesContext(connection) as big_network_queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(big_network_queries), len(small_network_queries))
+
+    def test_get_dependency_network_is_served_from_graph_cache(self):
+        url = reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('"dependencynetwork_task"."description"' in q['sql'] for q in queries))
+
+    def test_get_dependency_network_with_matching_etag_is_not_modified(self):
+        url = reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        Task.objects.create(dependency_network_id=1, name='sleep', description='sleep')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_graph_cache_is_invalidated_by_writes(self):
+        url = reverse('get_delete_update_task', kwargs={'aircraft_type': 'Boeing 777', 'name': 'boarding'})
+        self.assertEqual(len(self.client.get(url).data['dependents']), 1)
+        boarding = Task.objects.get(dependency_network_id=1, name='boarding')
+        cleaning = Task.objects.create(dependency_network_id=1, name='final cleaning', description='cleaning')
+        Dependency.objects.create(task=cleaning, depends_on_task=boarding)
+        self.assertEqual(len(self.client.get(url).data['dependents']), 2)
+        cleaning.delete()
+        self.assertEqual(len(self.client.get(url).data['dependents']), 1)
+
+    def test_get_existing_dependency_network_by_type_in_flat_layout(self):
+        # make boarding reachable through two paths, so it would be expanded twice in the nested layout
+        boarding = Task.objects.get(dependency_network_id=1, name='boarding')
+        cleaning = Task.objects.get(dependency_network_id=1, name='cleaning')
+        Dependency.objects.create(task=boarding, depends_on_task=cleaning)
+        response = self.client.get(
+            reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+            {'layout': 'flat'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(len(data['tasks']), 9)
+        self.assertEqual(len(set(t['name'] for t in data['tasks'])), 9)
+        self.assertEqual(len(data['dependencies']), 8)
+        self.assertIn({'task': boarding.id, 'depends_on_task': cleaning.id}, data['dependencies'])
+
+    def test_export_existing_dependency_network_by_type(self):
+        response = self.client.get(
+            reverse('export_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r['type'] for r in records], ['task'] * 9 + ['dependency'] * 7)
+        self.assertEqual(records[0], {'type': 'task', 'id': 1, 'name': 'ADO', 'description': 'ADO',
+                                      'earliest_start': '', 'duration': 0, 'latest_end': ''})
+        self.assertEqual(records[9], {'type': 'dependency', 'task': 3, 'depends_on_task': 1})
+
+    def test_locked_database_is_a_retryable_error(self):
+        response = exception_handler(OperationalError('database is locked'), {})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_get_reachability_of_task_pairs(self):
+        url = reverse('get_reachability', kwargs={'aircraft_type': 'Boeing 777'})
+        payload = {'pairs': [['ADC', 'security check'], ['security check', 'ADC'], ['cleaning', 'ADO'],
+                             ['ADC', 'ADO'], ['ADC', 'ADC']]}
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [True, False, True, False, False])
+        # the index is sized on its own, not hidden in the cached graph
+        self.assertEqual(reachability_cache.entries[1][0], DependencyNetwork.objects.get(id=1).version)
+        self.assertGreater(reachability_cache.size, 0)
+        self.assertEqual(get_dependency_graph(DependencyNetwork.objects.get(id=1)).derived, {})
+        # the index follows changes of the network
+        Dependency.objects.create(task=Task.objects.get(dependency_network_id=1, name='security check'),
+                                  depends_on_task=Task.objects.get(dependency_network_id=1, name='cleaning'))
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.data['results'], [True, False, True, True, False])
+        payload = {'pairs': [['ADC', 'ADO'], ['ADC', 'sleep'], ['ADC']]}
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(sorted(response.data['pairs']), [1, 2])
+
+    def test_get_reachability_of_network_too_big_to_index(self):
+        url = reverse('get_reachability', kwargs={'aircraft_type': 'Boeing 777'})
+        payload = {'pairs': [['ADC', 'security check'], ['security check', 'ADC'], ['cleaning', 'ADO'],
+                             ['ADC', 'ADO'], ['ADC', 'ADC'], ['boarding', 'security check']]}
+        max_size = reachability_cache.max_size
+        reachability_cache.max_size = 0
+        try:
+            response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        finally:
+            reachability_cache.max_size = max_size
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [True, False, True, False, False, True])
+        # no index was built to be thrown away
+        self.assertEqual(reachability_cache.size, 0)
+
+    def test_get_dependency_network_schedule(self):
+        timings = {'deboarding': ('', 10, ''), 'unloading': ('', 20, ''), 'offload catering': ('', 15, ''),
+                   'cleaning': ('', 20, ''), 'security check': ('D-40', 10, ''), 'cabin check': ('', 5, ''),
+                   'boarding': ('', 20, ''), 'ADC': ('', 0, 'D-5')}
+        for task in Task.objects.filter(dependency_network_id=1, name__in=timings):
+            task.earliest_start, task.duration, task.latest_end = timings[task.name]
+            task.save()
+        url = reverse('get_dependency_network_schedule', kwargs={'aircraft_type': 'Boeing 777'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'ground_time': 60})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['completion_time'], 50)
+        self.assertEqual(response.data['critical_path'], ['security check', 'boarding', 'ADC'])
+        tasks = {task['name']: task for task in response.data['tasks']}
+        self.assertEqual(tasks['boarding'], {'id': tasks['boarding']['id'], 'name': 'boarding',
+                                             'earliest_start': 30, 'earliest_finish': 50,
+                                             'latest_start': 35, 'latest_finish': 55, 'slack': 5})
+        self.assertEqual(tasks['security check']['earliest_start'], 20)
+        self.assertEqual(tasks['ADO']['latest_finish'], 30)
+
+    def test_get_task_delay_impact(self):
+        timings = {'deboarding': 10, 'cleaning': 20, 'offload catering': 15, 'security check': 10, 'boarding': 20}
+        for task in Task.objects.filter(dependency_network_id=1, name__in=timings):
+            task.duration = timings[task.name]
+            task.save()
+        url = reverse('get_task_delay_impact', kwargs={'aircraft_type': 'Boeing 777', 'name': 'offload catering'})
+        # offload catering has 5 minutes of slack, cleaning finishes last
+        response = self.client.get(url, {'minutes': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(t['name'], t['delay'], t['late']) for t in response.data['changed_tasks']],
+                         [('offload catering', 5, False)])
+        # the network has no ground time, so there is no departure to be at risk
+        self.assertIsNone(response.data['departure_at_risk'])
+        url = reverse('get_task_delay_impact', kwargs={'aircraft_type': 'Boeing 777', 'name': 'security check'})
+        response = self.client.get(url, {'minutes': 15, 'ground_time': 60})
+        self.assertEqual([(t['name'], t['earliest_finish'], t['late']) for t in response.data['changed_tasks']],
+                         [('security check', 25, False), ('boarding', 45, False), ('ADC', 45, False)])
+        self.assertEqual(response.data['completion_time'], 45)
+        response = self.client.get(url, {'minutes': 35, 'ground_time': 60})
+        self.assertTrue(response.data['departure_at_risk'])
+        self.assertEqual(response.data['completion_time'], 65)
+        # the baseline of each ground time is computed once per version
+        graph = get_dependency_graph(DependencyNetwork.objects.get(aircraft_type='Boeing 777'))
+        self.assertEqual(list(graph.derived['baseline_schedules']), [None, 60])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_evaluate_dependency_network_scenarios(self):
+        url = reverse('evaluate_dependency_network_scenarios', kwargs={'aircraft_type': 'Boeing 777'})
+        payload = {
+            'tasks': ['deboarding', 'cleaning', 'security check', 'boarding'],
+            'durations': [[10, 20, 10, 20], [10, 45, 10, 20], [10, 20, 70, 20]],
+        }
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['completion_times'], [30, 55, 90])
+        self.assertEqual([sorted(tasks) for tasks in response.data['critical_tasks']],
+                         [['ADC', 'ADO', 'boarding', 'cleaning', 'deboarding', 'security check'],
+                          ['ADO', 'cleaning', 'deboarding'],
+                          ['ADC', 'boarding', 'security check']])
+        payload['durations'] = [[10, 20, 10]]
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        payload = {'tasks': ['sleep'], 'durations': [[10]]}
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        payload = {'tasks': ['cleaning', 'boarding', 'cleaning'], 'durations': [[10, 20, 45]]}
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['tasks'], ['Duplicate task names: cleaning.'])
+        payload = {'tasks': ['cleaning'], 'durations': [[10]], 'ground_time': True}
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SCHEDULE_BATCH_CHUNK_SIZE=1, SCHEDULE_BATCH_WORKERS=2)
+    def test_evaluate_dependency_network_scenarios_in_worker_processes(self):
+        url = reverse('evaluate_dependency_network_scenarios', kwargs={'aircraft_type': 'Boeing 777'})
+        payload = {
+            'tasks': ['deboarding', 'cleaning', 'security check', 'boarding'],
+            'durations': [[10, 20, 10, 20], [10, 45, 10, 20], [10, 20, 70, 20]],
+        }
+        response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['completion_times'], [30, 55, 90])
+        self.assertEqual(sorted(response.data['critical_tasks'][1]), ['ADO', 'cleaning', 'deboarding'])
+
+    def test_get_root_and_leaf_tasks_of_dependency_network(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get_root_tasks', kwargs={'aircraft_type': 'Boeing 777'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['name'] for task in response.data], ['ADO', 'security check', 'cabin check'])
+        self.assertEqual(len([q for q in queries if 'dependencynetwork_task' in q['sql']]), 1)
+        response = self.client.get(reverse('get_leaf_tasks', kwargs={'aircraft_type': 'Boeing 777'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['name'] for task in response.data],
+                         ['offload catering', 'cleaning', 'unloading', 'ADC'])
 
     def test_get_non_existing_dependency_network_by_type(self):
         response = self.client.get(
@@ -89,11 +322,16 @@ class ApiTest(APITestCase):
 
     def test_delete_existing_dependency_network_by_type(self):
         # create a dummy, to-be-deleted network first; so the rest of the test cases won't be affected
-        DependencyNetwork.objects.create(
+        network = DependencyNetwork.objects.create(
             aircraft_type="Boeing 666", description="dependency network of Boeing 666 tasks")
+        sleep = Task.objects.create(dependency_network=network, name='sleep', description='sleep')
+        dream = Task.objects.create(dependency_network=network, name='dream', description='dream')
+        Dependency.objects.create(task=dream, depends_on_task=sleep)
         response = self.client.delete(
             reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 666'}))
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # the changes of the deleted tasks and dependency are not recorded
+        self.assertFalse(NetworkChange.objects.filter(dependency_network_id=network.id).exists())
 
     def test_delete_non_existing_dependency_network_by_type(self):
         response = self.client.delete(
@@ -200,6 +438,417 @@ class ApiTest(APITestCase):
         self.assertEqual(len(response.data['dependents']), 1)
         self.assertEqual(response.data['dependents'][0]['name'], 'ADC')
 
+    def test_get_upstream_tasks_by_type_and_name(self):
+        response = self.client.get(
+            reverse('get_upstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADC'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'ADC')
+        self.assertEqual(response.data['dependencies'][0]['name'], 'boarding')
+        self.assertEqual(sorted(t['name'] for t in response.data['dependencies'][0]['dependencies']),
+                         ['cabin check', 'security check'])
+        response = self.client.get(
+            reverse('get_upstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADC'}),
+            {'layout': 'flat', 'depth': 1})
+        self.assertEqual([(t['name'], t['depth']) for t in response.data], [('boarding', 1)])
+
+    def test_get_downstream_tasks_by_type_and_name(self):
+        response = self.client.get(
+            reverse('get_downstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADO'}),
+            {'layout': 'flat'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(t['name'], t['depth']) for t in response.data],
+                         [('deboarding', 1), ('unloading', 1), ('offload catering', 2), ('cleaning', 2)])
+        response = self.client.get(
+            reverse('get_downstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADO'}),
+            {'depth': 1})
+        self.assertEqual([t['dependents'] for t in response.data['dependents']], [[], []])
+        response = self.client.get(
+            reverse('get_downstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADO'}),
+            {'depth': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_task_closure_is_queried_in_one_round_trip_when_graph_is_not_cached(self):
+        url = reverse('get_downstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADO'})
+        for params in ({}, {'layout': 'flat'}, {'depth': 1}, {'layout': 'flat', 'depth': 1}):
+            graph_cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                from_db = self.client.get(url, params)
+            # one query for the network, one for the closure
+            network_queries = [q['sql'] for q in queries if 'dependencynetwork_' in q['sql']]
+            self.assertEqual(len(network_queries), 2)
+            self.assertIn('WITH RECURSIVE', network_queries[1])
+            self.client.get(reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}))
+            from_cache = self.client.get(url, params)
+            self.assertEqual(from_db.data, from_cache.data)
+
+    def test_task_closure_query_stops_at_cycles(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        # bypasses the api, which rejects cycles
+        Dependency.objects.create(task=Task.objects.get(dependency_network=network, name='ADO'),
+                                  depends_on_task=Task.objects.get(dependency_network=network, name='cleaning'))
+        graph_cache.clear()
+        response = self.client.get(
+            reverse('get_downstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'ADO'}),
+            {'layout': 'flat'})
+        self.assertEqual([(t['name'], t['depth']) for t in response.data],
+                         [('deboarding', 1), ('unloading', 1), ('offload catering', 2), ('cleaning', 2)])
+        response = self.client.get(
+            reverse('get_downstream_tasks', kwargs={'aircraft_type': 'Boeing 777', 'name': 'nope'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_dependency_graph_survives_pickling(self):
+        graph = get_dependency_graph(DependencyNetwork.objects.get(aircraft_type='Boeing 777'))
+        self.assertEqual(len(graph), 9)
+        self.assertEqual([graph.names[node] for node in graph.dependents(graph.get_task('ADO').node)],
+                         ['deboarding', 'unloading'])
+        copy = pickle.loads(pickle.dumps(graph))
+        self.assertEqual(FlatDependencyNetworkSerializer(copy).data, FlatDependencyNetworkSerializer(graph).data)
+        self.assertEqual(walk_flat(copy.get_task('ADO'), 'dependents'), walk_flat(graph.get_task('ADO'), 'dependents'))
+
+    def test_dependency_network_snapshot(self):
+        url = reverse('get_dependency_network_snapshot', kwargs={'aircraft_type': 'Boeing 777'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        graph = get_dependency_graph(network)
+        snapshot = DependencyNetworkSnapshot(response.content)
+        self.assertEqual((snapshot.dependency_network_id, snapshot.version), (network.id, network.version))
+        self.assertEqual(FlatDependencyNetworkSerializer(snapshot).data, FlatDependencyNetworkSerializer(graph).data)
+        self.assertEqual(walk_flat(snapshot.get_task('ADO'), 'dependents'),
+                         walk_flat(graph.get_task('ADO'), 'dependents'))
+        self.assertEqual(compute_schedule(snapshot), compute_schedule(graph))
+        snapshot.close()
+        with self.assertRaises(ValueError):
+            DependencyNetworkSnapshot(response.content[:100])
+
+    def test_export_dependency_network_snapshot_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'boeing-777.snapshot')
+            call_command('export_dependency_network_snapshot', 'Boeing 777', path, stdout=io.StringIO())
+            with DependencyNetworkSnapshot.open(path) as snapshot:
+                self.assertEqual(snapshot.get_task('boarding').dependents[0].name, 'ADC')
+                # travels to worker processes as its path
+                copy = pickle.loads(pickle.dumps(snapshot))
+                self.assertEqual(list(copy.names), list(snapshot.names))
+                copy.close()
+
+    def test_synthetic_network(self):
+        network = synthetic_network(500, layers=10, fan_in=3, diamonds=0.5)
+        self.assertEqual(network, synthetic_network(500, layers=10, fan_in=3, diamonds=0.5))
+        self.assertEqual(len(network['tasks']), 500)
+        dependencies = {}
+        for dependency in network['dependencies']:
+            dependencies.setdefault(dependency['task'], []).append(dependency['depends_on_task'])
+        self.assertTrue(all(1 <= len(parents) <= 3 for parents in dependencies.values()))
+        self.assertEqual(len(dependencies), 500 - 50)
+        dependents = {task['name']: [] for task in network['tasks']}
+        for dependency in network['dependencies']:
+            dependents[dependency['depends_on_task']].append(dependency['task'])
+        self.assertIsNone(find_cycle(dependents))
+        # two parents of some task share a parent of their own
+        self.assertTrue(any(len(parents) == 2 and set(dependencies.get(parents[0], ())) &
+                            set(dependencies.get(parents[1], ())) for parents in dependencies.values()))
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(sizes=[30], repeat=1)
+        self.assertEqual(results['30/get_dependency_network flat cold']['queries'], 3)
+        self.assertEqual(results['30/get_dependency_network flat']['queries'], 1)
+        self.assertEqual(compare_benchmarks(results, results), [])
+        slower = {key: dict(result, queries=result['queries'] + 1) for key, result in results.items()}
+        self.assertEqual(len(compare_benchmarks(slower, results)), len(results))
+
+    def test_server_timing_middleware(self):
+        url = reverse('get_delete_update_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        with self.modify_settings(MIDDLEWARE={'append': 'dependencynetwork.instrumentation.ServerTimingMiddleware'}):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.user.auth_token.key)
+            with self.assertLogs('dependencynetwork.timing', 'INFO') as logs:
+                response = client.get(url)
+            timings = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+            self.assertEqual(set(timings), {'sql', 'graph', 'serialize', 'render', 'total'})
+            self.assertIn('desc="4 queries"', timings['sql'])
+            record = json.loads(logs.records[0].getMessage())
+            self.assertEqual((record['path'], record['status'], record['sql_queries']),
+                             ('/dependency-network/Boeing 777', 200, 4))
+            self.assertNotIn('queries', record)
+
+            with self.settings(SERVER_TIMING_QUERY_LOG_THRESHOLD=0):
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION='Token ' + self.user.auth_token.key)
+                with self.assertLogs('dependencynetwork.timing') as logs:
+                    response = client.get(reverse('get_delete_update_task',
+                                                  kwargs={'aircraft_type': 'Boeing 777', 'name': 'boarding'}))
+            self.assertEqual(logs.records[0].levelname, 'WARNING')
+            # the token and the graph are cached by now
+            self.assertEqual(len(json.loads(logs.records[0].getMessage())['queries']), 1)
+            self.assertIn('render;dur=', response['Server-Timing'])
+
+    def test_token_authentication_is_cached_until_the_token_changes(self):
+        url = reverse('get_create_dependency_networks')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries if 'authtoken_token' in q['sql']])
+        self.user.auth_token.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_basic_authentication_is_cached_until_the_password_changes(self):
+        url = reverse('get_create_dependency_networks')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'test_user:F4kePaSsw0rd').decode())
+        client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries if 'auth_user' in q['sql']])
+        self.user.set_password('N3wPaSsw0rd')
+        self.user.save()
+        self.assertEqual(client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'test_user:N3wPaSsw0rd').decode())
+        self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_edit_dependency_network_in_one_transaction(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        operations = [
+            {'op': 'add_task', 'name': 'refueling', 'description': 'refueling', 'duration': 25},
+            {'op': 'add_dependency', 'task': 'refueling', 'depends_on_task': 'unloading'},
+            {'op': 'add_dependency', 'task': 'boarding', 'depends_on_task': 'refueling'},
+            {'op': 'remove_dependency', 'task': 'boarding', 'depends_on_task': 'cabin check'},
+            # swap two names
+            {'op': 'rename_task', 'name': 'cleaning', 'new_name': 'tmp'},
+            {'op': 'rename_task', 'name': 'offload catering', 'new_name': 'cleaning'},
+            {'op': 'rename_task', 'name': 'tmp', 'new_name': 'offload catering'},
+            {'op': 'delete_task', 'name': 'ADC'},
+            {'op': 'add_task', 'name': 'ADC', 'description': 'new ADC'},
+            {'op': 'add_dependency', 'task': 'ADC', 'depends_on_task': 'boarding'},
+        ]
+        cleaning_id = Task.objects.get(dependency_network=network, name='cleaning').id
+        response = self.client.post(reverse('edit_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+                                    data=json.dumps({'operations': operations}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted_tasks': 1, 'renamed_tasks': 2, 'created_tasks': 2,
+                                         'deleted_dependencies': 1, 'created_dependencies': 3})
+        self.assertEqual(Task.objects.get(id=cleaning_id).name, 'offload catering')
+        self.assertEqual(Task.objects.get(dependency_network=network, name='refueling').duration, 25)
+        self.assertEqual(sorted(Dependency.objects.filter(task__name='boarding', task__dependency_network=network)
+                                .values_list('depends_on_task__name', flat=True)), ['refueling', 'security check'])
+        self.assertEqual(Task.objects.get(dependency_network=network, name='ADC').description, 'new ADC')
+        self.assertTrue(Dependency.objects.filter(task__name='ADC', depends_on_task__name='boarding').exists())
+        # the version is bumped once for the whole batch
+        self.assertEqual(DependencyNetwork.objects.get(id=network.id).version, network.version + 1)
+
+    def test_edit_dependency_network_renames_next_to_any_task_name(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        cleaning = Task.objects.get(dependency_network=network, name='cleaning')
+        Task.objects.create(dependency_network=network, name='#%d' % cleaning.id, description='odd name')
+        operations = [{'op': 'remove_dependency', 'task': 'cleaning', 'depends_on_task': 'deboarding'},
+                      {'op': 'rename_task', 'name': 'cleaning', 'new_name': 'deep cleaning'}]
+        response = self.client.post(reverse('edit_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+                                    data=json.dumps({'operations': operations}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Task.objects.get(id=cleaning.id).name, 'deep cleaning')
+        self.assertFalse(Dependency.objects.filter(task=cleaning).exists())
+        self.assertTrue(Dependency.objects.filter(task__name='offload catering', task__dependency_network=network,
+                                                  depends_on_task__name='deboarding').exists())
+
+    def test_edit_dependency_network_writes_nothing_on_error(self):
+        url = reverse('edit_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        operations = [
+            {'op': 'add_task', 'name': 'refueling', 'description': 'refueling'},
+            {'op': 'rename_task', 'name': 'sleep', 'new_name': 'dream'},
+            {'op': 'add_dependency', 'task': 'refueling', 'depends_on_task': 'ADC'},
+            {'op': 'fly'},
+        ]
+        response = self.client.post(url, data=json.dumps({'operations': operations}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(sorted(response.data['operations']), [1, 3])
+        operations = [
+            {'op': 'add_task', 'name': 'refueling', 'description': 'refueling'},
+            {'op': 'add_dependency', 'task': 'refueling', 'depends_on_task': 'ADC'},
+            {'op': 'add_dependency', 'task': 'security check', 'depends_on_task': 'refueling'},
+        ]
+        response = self.client.post(url, data=json.dumps({'operations': operations}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['cycle'], ['security check', 'boarding', 'ADC', 'refueling', 'security check'])
+        self.assertFalse(Task.objects.filter(name='refueling').exists())
+
+    def test_dependency_network_changes_since_version(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        url = reverse('get_dependency_network_changes', kwargs={'aircraft_type': 'Boeing 777'})
+        ado = Task.objects.get(dependency_network=network, name='ADO')
+        refueling = Task.objects.create(dependency_network=network, name='refueling', description='refueling')
+        Dependency.objects.create(task=refueling, depends_on_task=ado)
+        refueling.duration = 25
+        refueling.save()
+        refueling_id = refueling.id
+        refueling.delete()
+
+        response = self.client.get(url, {'since': network.version})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], network.version + 5)
+        self.assertFalse(response.data['resync'])
+        self.assertEqual([(change['version'], change['kind'], change['action']) for change in response.data['changes']],
+                         [(network.version + 1, 'task', 'create'), (network.version + 2, 'dependency', 'create'),
+                          (network.version + 3, 'task', 'update'), (network.version + 4, 'dependency', 'delete'),
+                          (network.version + 5, 'task', 'delete')])
+        self.assertEqual(response.data['changes'][2]['data'], {
+            'id': refueling_id, 'name': 'refueling', 'description': 'refueling', 'earliest_start': '',
+            'duration': 25, 'latest_end': ''})
+        self.assertEqual(response.data['changes'][3]['data'], {'task': refueling_id, 'depends_on_task': ado.id})
+        self.assertEqual(response.data['changes'][4]['data'], {'id': refueling_id})
+        self.assertEqual(len(self.client.get(url, {'since': network.version + 3}).data['changes']), 2)
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_dependency_network_changes_of_a_batch_share_a_version(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        operations = [
+            {'op': 'add_task', 'name': 'refueling', 'description': 'refueling'},
+            {'op': 'add_dependency', 'task': 'refueling', 'depends_on_task': 'unloading'},
+            {'op': 'rename_task', 'name': 'cleaning', 'new_name': 'deep cleaning'},
+            {'op': 'delete_task', 'name': 'ADC'},
+        ]
+        self.client.post(reverse('edit_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+                         data=json.dumps({'operations': operations}), content_type='application/json')
+        response = self.client.get(reverse('get_dependency_network_changes', kwargs={'aircraft_type': 'Boeing 777'}),
+                                   {'since': network.version})
+        changes = response.data['changes']
+        self.assertEqual({change['version'] for change in changes}, {network.version + 1})
+        self.assertEqual(sorted((change['kind'], change['action']) for change in changes),
+                         [('dependency', 'create'), ('dependency', 'delete'), ('task', 'create'), ('task', 'delete'),
+                          ('task', 'update')])
+        refueling = Task.objects.get(dependency_network=network, name='refueling')
+        self.assertIn({'task': refueling.id, 'depends_on_task': Task.objects.get(dependency_network=network,
+                                                                                 name='unloading').id},
+                      [change['data'] for change in changes if change['kind'] == 'dependency'])
+        self.assertIn('deep cleaning', [change['data'].get('name') for change in changes])
+
+    def test_clone_dependency_network(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        network.ground_time = 45
+        network.save()
+        Task.objects.filter(dependency_network=network, name='boarding').update(duration=20, latest_end='D-5')
+        url = reverse('clone_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data=json.dumps({'aircraft_type': 'Boeing 787'}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['description'], response.data['ground_time']), (network.description, 45))
+        # the network, all tasks, all dependencies and the change log entry
+        self.assertEqual(len([query for query in queries if query['sql'].lstrip().startswith('INSERT')]), 4)
+        clone = DependencyNetwork.objects.get(aircraft_type='Boeing 787')
+        original_graph = get_dependency_graph(network)
+        clone_graph = get_dependency_graph(clone)
+        self.assertTrue(set(clone_graph.ids).isdisjoint(original_graph.ids))
+        for column in ('names', 'descriptions', 'earliest_starts', 'durations', 'latest_ends',
+                       'edge_tasks', 'edge_depends_on'):
+            self.assertEqual(list(getattr(clone_graph, column)), list(getattr(original_graph, column)))
+        self.assertEqual(clone.version, 1)
+        # the copied tasks and dependencies are not in the change log, syncing from before the clone needs a download
+        changes_url = reverse('get_dependency_network_changes', kwargs={'aircraft_type': 'Boeing 787'})
+        changes = self.client.get(changes_url, {'since': 0})
+        self.assertEqual(changes.data, {'version': 1, 'resync': True, 'changes': []})
+        changes = self.client.get(changes_url, {'since': 1})
+        self.assertEqual(changes.data, {'version': 1, 'resync': False, 'changes': []})
+        # the copy is independent of the original
+        Task.objects.filter(dependency_network=clone, name='ADC').delete()
+        self.assertTrue(Task.objects.filter(dependency_network=network, name='ADC').exists())
+
+    def test_clone_dependency_network_to_existing_aircraft_type(self):
+        url = reverse('clone_dependency_network', kwargs={'aircraft_type': 'Boeing 777'})
+        response = self.client.post(url, data=json.dumps({'aircraft_type': 'Airbus A380'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Task.objects.filter(dependency_network__aircraft_type='Airbus A380').count(), 1)
+        response = self.client.post(reverse('clone_dependency_network', kwargs={'aircraft_type': 'Boeing 787'}),
+                                    data=json.dumps({'aircraft_type': 'Boeing 797'}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_dependency_network_diff(self):
+        self.client.post(reverse('clone_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+                         data=json.dumps({'aircraft_type': 'Boeing 787'}), content_type='application/json')
+        operations = [
+            {'op': 'add_task', 'name': 'refueling', 'description': 'refueling', 'duration': 25},
+            {'op': 'add_dependency', 'task': 'refueling', 'depends_on_task': 'unloading'},
+            {'op': 'remove_dependency', 'task': 'boarding', 'depends_on_task': 'cabin check'},
+            {'op': 'delete_task', 'name': 'offload catering'},
+        ]
+        self.client.post(reverse('edit_dependency_network', kwargs={'aircraft_type': 'Boeing 787'}),
+                         data=json.dumps({'operations': operations}), content_type='application/json')
+        boarding = Task.objects.get(dependency_network__aircraft_type='Boeing 787', name='boarding')
+        boarding.duration = 20
+        boarding.latest_end = 'D-5'
+        boarding.save()
+
+        response = self.client.get(reverse('get_dependency_network_diff', kwargs={
+            'aircraft_type': 'Boeing 777', 'other_aircraft_type': 'Boeing 787'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['name'] for task in response.data['tasks']['added']], ['refueling'])
+        self.assertEqual([task['name'] for task in response.data['tasks']['removed']], ['offload catering'])
+        self.assertEqual(response.data['tasks']['changed'], [{'name': 'boarding', 'changes': {
+            'duration': {'from': 0, 'to': 20}, 'latest_end': {'from': '', 'to': 'D-5'}}}])
+        self.assertEqual(response.data['dependencies'], {
+            'added': [{'task': 'refueling', 'depends_on_task': 'unloading'}],
+            'removed': [{'task': 'offload catering', 'depends_on_task': 'deboarding'},
+                        {'task': 'boarding', 'depends_on_task': 'cabin check'}]})
+        # the other way around
+        response = self.client.get(reverse('get_dependency_network_diff', kwargs={
+            'aircraft_type': 'Boeing 787', 'other_aircraft_type': 'Boeing 777'}))
+        self.assertEqual([task['name'] for task in response.data['tasks']['added']], ['offload catering'])
+        response = self.client.get(reverse('get_dependency_network_diff', kwargs={
+            'aircraft_type': 'Boeing 777', 'other_aircraft_type': 'Boeing 797'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_diff_with_a_snapshot(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        with DependencyNetworkSnapshot(dump_snapshot(get_dependency_graph(network), network)) as snapshot:
+            self.assertEqual(diff_graphs(snapshot, get_dependency_graph(network)),
+                             {'tasks': {'added': [], 'removed': [], 'changed': []},
+                              'dependencies': {'added': [], 'removed': []}})
+            adc = Task.objects.get(dependency_network=network, name='ADC')
+            adc.description = 'new ADC'
+            adc.save()
+            network = DependencyNetwork.objects.get(id=network.id)
+            diff = diff_graphs(snapshot, get_dependency_graph(network))
+            self.assertEqual(diff['tasks']['changed'], [{'name': 'ADC', 'changes': {
+                'description': {'from': 'ADC', 'to': 'new ADC'}}}])
+
+    def test_dependency_network_levels(self):
+        url = reverse('get_dependency_network_levels', kwargs={'aircraft_type': 'Boeing 777'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['waves'], [['ADO', 'security check', 'cabin check'],
+                                                    ['deboarding', 'unloading', 'boarding'],
+                                                    ['offload catering', 'cleaning', 'ADC']])
+        # the level is the longest path from a root, not the shortest
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        refueling = Task.objects.create(dependency_network=network, name='refueling', description='refueling')
+        Dependency.objects.create(task=refueling, depends_on_task=Task.objects.get(dependency_network=network,
+                                                                                   name='ADO'))
+        Dependency.objects.create(task=refueling, depends_on_task=Task.objects.get(dependency_network=network,
+                                                                                   name='offload catering'))
+        response = self.client.get(url)
+        order = response.json()['order']
+        self.assertEqual(order[-1], {'id': refueling.id, 'name': 'refueling', 'level': 3})
+        positions = {task['name']: position for position, task in enumerate(order)}
+        for task, depends_on_task in Dependency.objects.filter(task__dependency_network=network) \
+                .values_list('task__name', 'depends_on_task__name'):
+            self.assertLess(positions[depends_on_task], positions[task])
+        # computed once per version
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(any('"dependencynetwork_task"' in query['sql'] for query in queries))
+
+    def test_dependency_network_levels_with_cycle(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        Dependency.objects.create(task=Task.objects.get(dependency_network=network, name='ADO'),
+                                  depends_on_task=Task.objects.get(dependency_network=network, name='cleaning'))
+        response = self.client.get(reverse('get_dependency_network_levels', kwargs={'aircraft_type': 'Boeing 777'}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
     def test_delete_non_existing_task_by_type_and_name(self):
         response = self.client.delete(
             reverse('get_delete_update_task', kwargs={'aircraft_type': 'Boeing 777',
@@ -218,6 +867,19 @@ class ApiTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(len(Task.objects.filter(dependency_network_id=1)), 9)
 
+    def test_delete_task_with_dependencies_bumps_the_version_once(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        boarding = Task.objects.get(dependency_network=network, name='boarding')
+        dependencies = Dependency.objects.filter(task=boarding).count() + \
+            Dependency.objects.filter(depends_on_task=boarding).count()
+        response = self.client.delete(
+            reverse('get_delete_update_task', kwargs={'aircraft_type': 'Boeing 777', 'name': 'boarding'}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        changes = NetworkChange.objects.filter(dependency_network=network, version__gt=network.version)
+        self.assertEqual(set(changes.values_list('version', flat=True)), {network.version + 1})
+        self.assertEqual(changes.filter(kind='dependency', action='delete').count(), dependencies)
+        self.assertEqual(changes.filter(kind='task', action='delete').count(), 1)
+
     def test_update_non_existing_task_by_type_and_name(self):
         valid_payload = {
             'name': 'do something useful',
@@ -271,6 +933,20 @@ class ApiTest(APITestCase):
         self.assertEqual(task.description, 'sleep as all other people working')
         task.delete()
 
+    def test_update_existing_task_by_type_and_name_with_existing_name(self):
+        payload = {
+            'name': 'ADC',
+            'description': 'instructions',
+        }
+        response = self.client.put(
+            reverse('get_delete_update_task', kwargs={'aircraft_type': 'Boeing 777', 'name': 'boarding'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(len(Task.objects.filter(dependency_network_id=1, name='ADC')), 1)
+        self.assertEqual(len(Task.objects.filter(dependency_network_id=1, name='boarding')), 1)
+
     def test_create_single_task_with_invalid_payload(self):
         invalid_payload = {
             'dependency_network_id': 1,
@@ -375,6 +1051,96 @@ class ApiTest(APITestCase):
         successor1.delete()
         successor2.delete()
 
+    def test_import_dependency_network_with_valid_payload(self):
+        payload = {
+            'tasks': [
+                {'name': 'fuelling', 'description': 'instructions for fuelling'},
+                {'name': 'pushback', 'description': 'instructions for pushback'},
+            ],
+            'dependencies': [
+                {'task': 'fuelling', 'depends_on_task': 'ADO'},
+                {'task': 'pushback', 'depends_on_task': 'fuelling'},
+                {'task': 'pushback', 'depends_on_task': 'ADC'},
+            ]
+        }
+        response = self.client.post(
+            reverse('import_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'tasks': 2, 'dependencies': 3})
+        pushback = Task.objects.get(dependency_network_id=1, name='pushback')
+        self.assertEqual(set(Dependency.objects.filter(task=pushback).values_list('depends_on_task__name', flat=True)),
+                         {'fuelling', 'ADC'})
+        response = self.client.get(
+            reverse('get_delete_update_task', kwargs={'aircraft_type': 'Boeing 777', 'name': 'fuelling'}))
+        self.assertEqual(response.data['dependents'][0]['name'], 'pushback')
+
+    def test_import_dependency_network_with_invalid_payload(self):
+        payload = {
+            'tasks': [
+                {'name': 'fuelling', 'description': 'instructions for fuelling'},
+                {'name': 'fuelling', 'description': 'instructions for fuelling'},
+                {'name': 'boarding', 'description': 'instructions for boarding'},
+                {'name': '', 'description': 'instructions'},
+            ],
+            'dependencies': [
+                {'task': 'fuelling', 'depends_on_task': 'sleep'},
+                {'task': 'ADC', 'depends_on_task': 'boarding'},
+            ]
+        }
+        response = self.client.post(
+            reverse('import_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(sorted(response.data['tasks']), [1, 2, 3])
+        self.assertEqual(sorted(response.data['dependencies']), [0, 1])
+        self.assertFalse(Task.objects.filter(name='fuelling').exists())
+        # a time followed by a newline is not a time
+        payload = {'tasks': [{'name': 'fuelling', 'description': 'fuelling', 'earliest_start': 'A+5\n'}]}
+        response = self.client.post(
+            reverse('import_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data['tasks']), [0])
+
+    def test_import_dependency_network_with_cycle(self):
+        payload = {
+            'tasks': [{'name': 'fuelling', 'description': 'instructions for fuelling'}],
+            'dependencies': [
+                {'task': 'fuelling', 'depends_on_task': 'ADC'},
+                {'task': 'boarding', 'depends_on_task': 'fuelling'},
+            ]
+        }
+        response = self.client.post(
+            reverse('import_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(len(response.data['cycle']), 4)
+        self.assertFalse(Task.objects.filter(name='fuelling').exists())
+
+    def test_import_dependency_network_with_concurrently_created_task(self):
+        network = DependencyNetwork.objects.get(aircraft_type='Boeing 777')
+        get_dependency_graph(network)
+        # bulk_create sends no signals, the cached graph doesn't know about the task like a write that committed
+        # after it was read
+        Task.objects.bulk_create([Task(dependency_network=network, name='fuelling', description='fuelling')])
+        payload = {'tasks': [{'name': 'fuelling', 'description': 'instructions for fuelling'}], 'dependencies': []}
+        response = self.client.post(
+            reverse('import_dependency_network', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Task.objects.filter(dependency_network=network, name='fuelling').count(), 1)
+
     def test_create_dependency_with_valid_payload(self):
         # create a dummy, to-be-deleted task first; so the rest of the test cases won't be affected
         task1 = Task.objects.create(dependency_network_id=1, name='sleep',
@@ -396,6 +1162,69 @@ class ApiTest(APITestCase):
         task1.delete()
         task2.delete()
 
+    def test_create_existing_dependency(self):
+        valid_payload = {
+            'task': 'ADC',
+            'depends_on_task': 'boarding',
+        }
+        response = self.client.post(
+            reverse('create_delete_dependency', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(valid_payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(Dependency.objects.filter(task__name='ADC', depends_on_task__name='boarding')), 1)
+
+    def test_create_dependency_closing_a_cycle(self):
+        payload = {
+            'task': 'security check',
+            'depends_on_task': 'ADC',
+        }
+        response = self.client.post(
+            reverse('create_delete_dependency', kwargs={'aircraft_type': 'Boeing 777'}),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['cycle'], ['ADC', 'security check', 'boarding', 'ADC'])
+        self.assertFalse(Dependency.objects.filter(task__name='security check', depends_on_task__name='ADC').exists())
+
+    def test_create_dependency_reads_only_the_tasks_downstream(self):
+        url = reverse('create_delete_dependency', kwargs={'aircraft_type': 'Boeing 777'})
+        # a long chain below cleaning, closing the cycle needs all of it
+        parent_task = Task.objects.get(dependency_network_id=1, name='cleaning')
+        for i in range(30):
+            task = Task.objects.create(dependency_network_id=1, name='chain %s' % 'abcdefghijklmnopqrstuvwxyzABCD'[i],
+                                       description='chain')
+            Dependency.objects.create(task=task, depends_on_task=parent_task)
+            parent_task = task
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data=json.dumps({'task': 'ADO', 'depends_on_task': 'chain D'}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['cycle'][:3], ['chain D', 'ADO', 'deboarding'])
+        self.assertEqual(len(response.data['cycle']), 34)
+        # no full graph load, whatever the size of the network
+        self.assertFalse(any('"dependencynetwork_task"."description"' in query['sql'] for query in queries))
+        response = self.client.post(url, data=json.dumps({'task': 'chain D', 'depends_on_task': 'ADO'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_create_multiple_tasks_closing_a_cycle(self):
+        payload = {
+            'task': {'dependency_network_id': 1, 'name': 'new task', 'description': 'instructions for new task'},
+            'dependencies': [{'dependency_network_id': 1, 'name': 'ADC', 'description': 'ADC'}],
+            'dependents': [{'dependency_network_id': 1, 'name': 'boarding', 'description': 'boarding'}]
+        }
+        response = self.client.post(
+            reverse('create_batch_tasks'),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['cycle'], ['new task', 'boarding', 'ADC', 'new task'])
+        self.assertFalse(Task.objects.filter(name='new task').exists())
+
     def test_create_dependency_with_invalid_payload(self):
         invalid_payload = {
             'task': '',
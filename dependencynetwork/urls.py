@@ -22,6 +22,71 @@ urlpatterns = [
                         DELETE=views.delete_update_dependency_network),
         name='get_delete_update_dependency_network'
     ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/import$',
+        method_dispatch(POST=views.import_dependency_network),
+        name='import_dependency_network'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/export$',
+        method_dispatch(GET=views.export_dependency_network_stream),
+        name='export_dependency_network'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/reachability$',
+        method_dispatch(POST=views.get_reachability),
+        name='get_reachability'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/levels$',
+        method_dispatch(GET=views.get_dependency_network_levels),
+        name='get_dependency_network_levels'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/schedule$',
+        method_dispatch(GET=views.get_dependency_network_schedule),
+        name='get_dependency_network_schedule'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/schedule/batch$',
+        method_dispatch(POST=views.evaluate_dependency_network_scenarios),
+        name='evaluate_dependency_network_scenarios'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/clone$',
+        method_dispatch(POST=views.clone_dependency_network),
+        name='clone_dependency_network'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/diff/(?P<other_aircraft_type>[A-Za-z0-9_ ]+)$',
+        method_dispatch(GET=views.get_dependency_network_diff),
+        name='get_dependency_network_diff'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/edit$',
+        method_dispatch(POST=views.edit_dependency_network),
+        name='edit_dependency_network'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/changes$',
+        method_dispatch(GET=views.get_dependency_network_changes),
+        name='get_dependency_network_changes'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/snapshot$',
+        method_dispatch(GET=views.get_dependency_network_snapshot),
+        name='get_dependency_network_snapshot'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/roots$',
+        method_dispatch(GET=views.get_root_tasks_of_dependency_network),
+        name='get_root_tasks'
+    ),
+    url(
+        r'^dependency-network/(?P<aircraft_type>[A-Za-z0-9_ ]+)/leaves$',
+        method_dispatch(GET=views.get_leaf_tasks_of_dependency_network),
+        name='get_leaf_tasks'
+    ),
     url(
         r'^dependency-network$',
         method_dispatch(GET=views.get_all_dependency_networks,
@@ -35,6 +100,21 @@ urlpatterns = [
                         DELETE=views.delete_update_task),
         name='get_delete_update_task'
     ),
+    url(
+        r'^task/(?P<aircraft_type>[A-Za-z0-9_ ]+)/(?P<name>[A-Za-z_ ]+)/upstream$',
+        method_dispatch(GET=views.get_upstream_tasks),
+        name='get_upstream_tasks'
+    ),
+    url(
+        r'^task/(?P<aircraft_type>[A-Za-z0-9_ ]+)/(?P<name>[A-Za-z_ ]+)/downstream$',
+        method_dispatch(GET=views.get_downstream_tasks),
+        name='get_downstream_tasks'
+    ),
+    url(
+        r'^task/(?P<aircraft_type>[A-Za-z0-9_ ]+)/(?P<name>[A-Za-z_ ]+)/delay$',
+        method_dispatch(GET=views.get_task_delay_impact),
+        name='get_task_delay_impact'
+    ),
     url(
         r'^task$',
         method_dispatch(POST=views.create_single_task),
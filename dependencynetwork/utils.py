@@ -1,30 +1,911 @@
+import hashlib
+import json
+import operator
+import re
+import sys
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict, deque
+from functools import reduce
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from rest_framework.renderers import JSONRenderer
+
+from dependencynetwork.cache import graph_cache, reachability_cache, response_cache
+from dependencynetwork.instrumentation import timed
 from dependencynetwork.models import *
+from dependencynetwork.serializer import *
+from dependencynetwork.signals import bump_version, deferred_version_bump, record_change, task_data
+
+
+# the columns of a task kept in a DependencyGraph, in the order load_dependency_graph fetches them
+GRAPH_TASK_FIELDS = ('id', 'name', 'description') + TIMING_FIELDS
+
+
+# compact in-memory view of a dependency network. tasks are numbered 0..n-1 in id order ("nodes") and their columns
+# are kept in parallel arrays, dependencies and dependents are stored as CSR adjacency: the parents of node i are
+# dependency_indices[dependency_offsets[i]:dependency_offsets[i + 1]], in the order the dependencies were created.
+# there are only ints and strings in it, so a cached graph is small and cheap to pickle; graph.task(node) gives a
+# TaskNode view for code that wants task objects (serializers...)
+class DependencyGraph(object):
+
+    def __init__(self, tasks, edges):
+        self.ids = array('q')
+        self.names = []
+        self.descriptions = []
+        self.earliest_starts = []
+        self.durations = array('q')
+        self.latest_ends = []
+        for task_id, name, description, earliest_start, duration, latest_end in tasks:
+            self.ids.append(task_id)
+            self.names.append(name)
+            self.descriptions.append(description)
+            self.earliest_starts.append(earliest_start)
+            self.durations.append(duration)
+            self.latest_ends.append(latest_end)
+        self.nodes_by_name = {name: node for node, name in enumerate(self.names)}
+        self.edge_tasks = array('i')
+        self.edge_depends_on = array('i')
+        for task_id, depends_on_task_id in edges:
+            self.edge_tasks.append(self.node(task_id))
+            self.edge_depends_on.append(self.node(depends_on_task_id))
+        self.dependency_offsets, self.dependency_indices = self.csr(self.edge_tasks, self.edge_depends_on)
+        self.dependent_offsets, self.dependent_indices = self.csr(self.edge_depends_on, self.edge_tasks)
+        self.derived = {}
+
+    # counting sort of the edges by source, stable so every node keeps its neighbours in edge order
+    def csr(self, sources, targets):
+        offsets = array('i', [0]) * (len(self.ids) + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        for node in range(len(self.ids)):
+            offsets[node + 1] += offsets[node]
+        indices = array('i', [0]) * len(targets)
+        filled = array('i', offsets)
+        for source, target in zip(sources, targets):
+            indices[filled[source]] = target
+            filled[source] += 1
+        return offsets, indices
+
+    # derived values are recomputed on demand, they don't travel with the graph
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['derived'] = {}
+        return state
+
+    def __len__(self):
+        return len(self.ids)
+
+    # node of a task id, None if the task is not in the graph
+    def node(self, task_id):
+        node = bisect_left(self.ids, task_id)
+        return node if node < len(self.ids) and self.ids[node] == task_id else None
+
+    def task(self, node):
+        return TaskNode(self, node)
+
+    def tasks(self):
+        return [TaskNode(self, node) for node in range(len(self.ids))]
+
+    def get_task(self, name):
+        try:
+            return TaskNode(self, self.nodes_by_name[name])
+        except (KeyError, TypeError):
+            raise Task.DoesNotExist
+
+    def dependencies(self, node):
+        return self.dependency_indices[self.dependency_offsets[node]:self.dependency_offsets[node + 1]]
+
+    def dependents(self, node):
+        return self.dependent_indices[self.dependent_offsets[node]:self.dependent_offsets[node + 1]]
+
+    def roots(self):
+        offsets = self.dependency_offsets
+        return [node for node in range(len(self.ids)) if offsets[node] == offsets[node + 1]]
+
+    # (task id, depends on task id) of every dependency, in the order they were created
+    def edges(self):
+        ids = self.ids
+        return [(ids[task], ids[depends_on_task]) for task, depends_on_task in zip(self.edge_tasks,
+                                                                                     self.edge_depends_on)]
+
+    # values computed from the graph on first use (topological positions...), they live as long as this version is
+    # cached. only for values about as big as the graph, the graph cache sizes entries by the graph alone
+    def get_derived(self, key, compute):
+        try:
+            return self.derived[key]
+        except KeyError:
+            value = self.derived[key] = compute(self)
+            return value
+
+
+# a task of a DependencyGraph, read from its arrays. has the attributes of a Task that TaskSerializer and
+# FlatTaskSerializer read, with `dependencies` and `dependents` as TaskNodes too
+class TaskNode(object):
+    __slots__ = ('graph', 'node')
+
+    def __init__(self, graph, node):
+        self.graph = graph
+        self.node = node
+
+    def __eq__(self, other):
+        return isinstance(other, TaskNode) and self.graph is other.graph and self.node == other.node
+
+    def __hash__(self):
+        return hash(self.node)
+
+    @property
+    def id(self):
+        return self.graph.ids[self.node]
+
+    @property
+    def name(self):
+        return self.graph.names[self.node]
+
+    @property
+    def description(self):
+        return self.graph.descriptions[self.node]
+
+    @property
+    def earliest_start(self):
+        return self.graph.earliest_starts[self.node]
+
+    @property
+    def duration(self):
+        return self.graph.durations[self.node]
+
+    @property
+    def latest_end(self):
+        return self.graph.latest_ends[self.node]
+
+    @property
+    def dependencies(self):
+        return [TaskNode(self.graph, node) for node in self.graph.dependencies(self.node)]
+
+    @property
+    def dependents(self):
+        return [TaskNode(self.graph, node) for node in self.graph.dependents(self.node)]
+
+
+def load_dependency_graph(dependency_network_id):
+    # two queries regardless of the network size: one for the tasks, one for the edges between them
+    tasks = Task.objects.filter(dependency_network_id=dependency_network_id).order_by('id') \
+        .values_list(*GRAPH_TASK_FIELDS)
+    edges = Dependency.objects.filter(task__dependency_network_id=dependency_network_id,
+                                      depends_on_task__dependency_network_id=dependency_network_id) \
+        .order_by('id').values_list('task_id', 'depends_on_task_id')
+    with timed('graph'):
+        return DependencyGraph(tasks, edges)
+
+
+def get_dependency_graph(dependency_network):
+    graph = get_cached_dependency_graph(dependency_network)
+    if graph is None:
+        graph = load_dependency_graph(dependency_network.id)
+        graph_cache.set(dependency_network.id, dependency_network.version, graph,
+                        len(graph) + len(graph.edge_tasks))
+    return graph
+
+
+# the graph of the network if this version is already cached, None otherwise
+def get_cached_dependency_graph(dependency_network):
+    return graph_cache.get(dependency_network.id, dependency_network.version)
+
+
+def serialize_dependency_network(dependency_network, layout):
+    graph = get_dependency_graph(dependency_network)
+    with timed('serialize'):
+        if layout == 'flat':
+            return FlatDependencyNetworkSerializer(graph).data
+        return TaskSerializer([graph.task(node) for node in graph.roots()], many=True).data
+
+
+# tasks that don't depend on any other task, in one query with a NOT EXISTS subquery on the dependency table
+def get_root_tasks(dependency_network_id):
+    dependencies = Dependency.objects.filter(task_id=OuterRef('id'))
+    return Task.objects.filter(dependency_network_id=dependency_network_id) \
+        .annotate(has_dependencies=Exists(dependencies)).filter(has_dependencies=False).order_by('id')
+
+
+# tasks no other task depends on
+def get_leaf_tasks(dependency_network_id):
+    dependents = Dependency.objects.filter(depends_on_task_id=OuterRef('id'))
+    return Task.objects.filter(dependency_network_id=dependency_network_id) \
+        .annotate(has_dependents=Exists(dependents)).filter(has_dependents=False).order_by('id')
+
+
+# the change log after the given version, in the order the changes were made. replaying it on a copy of the network
+# at that version brings the copy to the current version. the tasks and dependencies copied by a clone are not in the
+# log, so None is returned for versions before the clone: the client has to download the whole network again
+def get_changes_since(dependency_network_id, version):
+    changes = NetworkChange.objects.filter(dependency_network_id=dependency_network_id, version__gt=version) \
+        .order_by('version', 'id').values_list('version', 'kind', 'action', 'data')
+    if any((kind, action) == ('network', 'clone') for _, kind, action, _ in changes):
+        return None
+    return [{'version': version, 'kind': kind, 'action': action, 'data': json.loads(data)}
+            for version, kind, action, data in changes]
+
+
+# returns the json bytes of the network in the given layout and their strong etag, rendered once per version
+def render_dependency_network(dependency_network, layout):
+    key = (dependency_network.id, layout)
+    rendered = response_cache.get(key, dependency_network.version)
+    if rendered is None:
+        data = serialize_dependency_network(dependency_network, layout)
+        with timed('render'):
+            content = JSONRenderer().render(data)
+        rendered = (content, '"%s"' % hashlib.md5(content).hexdigest())
+        response_cache.set(key, dependency_network.version, rendered, len(content))
+    return rendered
+
+
+# returns the json bytes of the topological order and parallel waves of the network and their strong etag, computed
+# and rendered once per version. raises ValueError if the network has a cycle
+def render_topological_levels(dependency_network):
+    key = (dependency_network.id, 'levels')
+    rendered = response_cache.get(key, dependency_network.version)
+    if rendered is None:
+        graph = get_dependency_graph(dependency_network)
+        levels = graph.get_derived('topological_levels', topological_levels)
+        if levels is None:
+            raise ValueError('dependency network has a cycle')
+        order, node_levels = levels
+        waves = []
+        for node in order:
+            if node_levels[node] == len(waves):
+                waves.append([])
+            waves[-1].append(graph.names[node])
+        data = {'order': [{'id': graph.ids[node], 'name': graph.names[node], 'level': node_levels[node]}
+                          for node in order],
+                'waves': waves}
+        with timed('render'):
+            content = JSONRenderer().render(data)
+        rendered = (content, '"%s"' % hashlib.md5(content).hexdigest())
+        response_cache.set(key, dependency_network.version, rendered, len(content))
+    return rendered
+
+
+# breadth-first walk from task over the `dependents` or `dependencies` of the graph, at most max_depth levels deep
+# (None for all). returns [(node, depth)] in visiting order, every node once with its shortest distance from the task
+def walk(task, direction, max_depth=None):
+    neighbours = getattr(task.graph, direction)
+    depths = {task.node: 0}
+    queue = deque([task.node])
+    visited = []
+    while queue:
+        current = queue.popleft()
+        depth = depths[current]
+        if depth == max_depth:
+            continue
+        for neighbour in neighbours(current):
+            if neighbour not in depths:
+                depths[neighbour] = depth + 1
+                visited.append((neighbour, depth + 1))
+                queue.append(neighbour)
+    return visited
+
+
+def walk_flat(task, direction, max_depth=None):
+    graph = task.graph
+    return [{'id': graph.ids[node], 'name': graph.names[node], 'description': graph.descriptions[node], 'depth': depth}
+            for node, depth in walk(task, direction, max_depth)]
+
+
+# same tree as TaskSerializer renders, but cut at max_depth levels and built without recursion.
+# subtrees reached through several paths are built once and shared
+def walk_nested(task, direction, max_depth=None):
+    graph = task.graph
+    neighbours = getattr(graph, direction)
+    built = {}
+    in_progress = set()
+    stack = [(task.node, max_depth)]
+    while stack:
+        node, remaining = stack[-1]
+        key = (node, remaining)
+        children = neighbours(node) if remaining != 0 else ()
+        child_remaining = None if remaining is None else remaining - 1
+        if key not in in_progress:
+            in_progress.add(key)
+            # children that are still in progress would close a cycle, they are left out
+            stack.extend((child, child_remaining) for child in children
+                         if (child, child_remaining) not in built and (child, child_remaining) not in in_progress)
+            continue
+        stack.pop()
+        if key not in built:
+            built[key] = {'id': graph.ids[node], 'name': graph.names[node], 'description': graph.descriptions[node],
+                          direction: [built[(child, child_remaining)] for child in children
+                                      if (child, child_remaining) in built]}
+    return built[(task.node, max_depth)]
+
+
+# closure of a task computed by the db in one round trip: a recursive cte collects the ids of every task reachable
+# over `dependents` or `dependencies` (UNION drops rows already seen, so a cycle in the data ends the recursion),
+# then every task of the closure is returned with the edges between them, which is all walk_flat/walk_nested need.
+# with max_depth the rows carry their depth too and the recursion stops at that depth.
+CLOSURE_QUERY = '''
+WITH RECURSIVE closure({closure_columns}) AS (
+    SELECT id{seed_depth} FROM {task} WHERE dependency_network_id = %s AND name = %s
+    UNION
+    SELECT d.{to_column}{step_depth} FROM closure c JOIN {dependency} d ON d.{from_column} = c.id{depth_limit}
+)
+SELECT {task_columns}, d.id, d.task_id, d.depends_on_task_id
+FROM {task} t
+LEFT JOIN {dependency} d ON d.{from_column} = t.id AND d.{to_column} IN (SELECT id FROM closure)
+WHERE t.id IN (SELECT id FROM closure)
+ORDER BY t.id
+'''
+
+
+def query_task_closure(dependency_network_id, name, direction, max_depth=None):
+    from_column, to_column = ('depends_on_task_id', 'task_id') if direction == 'dependents' \
+        else ('task_id', 'depends_on_task_id')
+    query = CLOSURE_QUERY.format(
+        closure_columns='id' if max_depth is None else 'id, depth',
+        seed_depth='' if max_depth is None else ', 0',
+        step_depth='' if max_depth is None else ', c.depth + 1',
+        depth_limit='' if max_depth is None else ' WHERE c.depth < %s',
+        task=connection.ops.quote_name(Task._meta.db_table),
+        dependency=connection.ops.quote_name(Dependency._meta.db_table),
+        task_columns=', '.join('t.%s' % field for field in GRAPH_TASK_FIELDS),
+        from_column=from_column, to_column=to_column)
+    params = [dependency_network_id, name] + ([] if max_depth is None else [max_depth])
+    tasks = OrderedDict()
+    edges = {}
+    with timed('graph'), connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for row in cursor.fetchall():
+            task, (dependency_id, task_id, depends_on_task_id) = row[:len(GRAPH_TASK_FIELDS)], row[-3:]
+            tasks.setdefault(task[0], task)
+            if dependency_id is not None:
+                edges[dependency_id] = (task_id, depends_on_task_id)
+    graph = DependencyGraph(tasks.values(), [edges[dependency_id] for dependency_id in sorted(edges)])
+    return graph.get_task(name)
+
+
+# kahn's algorithm, parents always come before their dependents. returns the nodes in that order, or None if the
+# graph has a cycle
+def topological_order(graph):
+    offsets = graph.dependency_offsets
+    in_degrees = array('i', (offsets[node + 1] - offsets[node] for node in range(len(graph))))
+    queue = deque(graph.roots())
+    order = []
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for dependent in graph.dependents(node):
+            in_degrees[dependent] -= 1
+            if not in_degrees[dependent]:
+                queue.append(dependent)
+    return order if len(order) == len(graph) else None
+
+
+# kahn's algorithm keeping the level of every node on the way: the longest path from a root to it, so tasks of one
+# level never depend on each other and can run in parallel. returns (nodes ordered by level, levels indexed by node),
+# or None if the graph has a cycle
+def topological_levels(graph):
+    offsets = graph.dependency_offsets
+    in_degrees = array('i', (offsets[node + 1] - offsets[node] for node in range(len(graph))))
+    levels = array('i', [0]) * len(graph)
+    queue = deque(graph.roots())
+    order = []
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        level = levels[node] + 1
+        for dependent in graph.dependents(node):
+            if levels[dependent] < level:
+                levels[dependent] = level
+            in_degrees[dependent] -= 1
+            if not in_degrees[dependent]:
+                queue.append(dependent)
+    if len(order) != len(graph):
+        return None
+    # levels grow along every dependency, so the order stays topological
+    order.sort(key=levels.__getitem__)
+    return order, levels
+
+
+# transitive closure of the network: every node gets a bitset (python int) of all its downstream nodes,
+# built in reverse topological order. "does a depend on b" is then a single bit test
+class ReachabilityIndex(object):
+
+    def __init__(self, graph):
+        order = topological_order(graph)
+        if order is None:
+            raise ValueError('dependency network has a cycle')
+        self.positions = array('i', [0]) * len(order)
+        for position, node in enumerate(order):
+            self.positions[node] = position
+        self.downstream = [0] * len(order)
+        for position in range(len(order) - 1, -1, -1):
+            bits = 0
+            for dependent in graph.dependents(order[position]):
+                dependent_position = self.positions[dependent]
+                bits |= (1 << dependent_position) | self.downstream[dependent_position]
+            self.downstream[position] = bits
+
+    def depends_on(self, node, depends_on_node):
+        return bool(self.downstream[self.positions[depends_on_node]] >> self.positions[node] & 1)
+
+    # approximate memory use in bytes
+    def size(self):
+        return sum(map(sys.getsizeof, self.downstream)) + sys.getsizeof(self.downstream) + \
+            self.positions.itemsize * len(self.positions)
+
+
+def get_reachability_index(dependency_network):
+    index = reachability_cache.get(dependency_network.id, dependency_network.version)
+    if index is None:
+        index = ReachabilityIndex(get_dependency_graph(dependency_network))
+        reachability_cache.set(dependency_network.id, dependency_network.version, index, index.size())
+    return index
+
+
+# upper bound of the memory use of the ReachabilityIndex of a graph: every task downstream of every other one
+def reachability_index_size(graph):
+    return len(graph) * sys.getsizeof(1 << len(graph)) + sys.getsizeof([]) + 8 * len(graph) + 4 * len(graph)
+
+
+# for each (node, depends on node) pair whether node (transitively) depends on depends_on_node. answered from the
+# cached index if it fits in REACHABILITY_CACHE_SIZE. bigger networks would build it again on every request, there
+# the dependents of every distinct depends on node are walked instead, until all the nodes asked about are found.
+# raises ValueError if the network has a cycle
+def check_reachability(dependency_network, node_pairs):
+    graph = get_dependency_graph(dependency_network)
+    if reachability_index_size(graph) <= reachability_cache.max_size:
+        index = get_reachability_index(dependency_network)
+        return [index.depends_on(node, depends_on_node) for node, depends_on_node in node_pairs]
+
+    if graph.get_derived('topological_levels', topological_levels) is None:
+        raise ValueError('dependency network has a cycle')
+    nodes_by_depends_on_node = defaultdict(set)
+    for node, depends_on_node in node_pairs:
+        nodes_by_depends_on_node[depends_on_node].add(node)
+    reachable = set()
+    for depends_on_node, nodes in nodes_by_depends_on_node.items():
+        missing = set(nodes)
+        seen = {depends_on_node}
+        stack = [depends_on_node]
+        while stack and missing:
+            for dependent in graph.dependents(stack.pop()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+                    if dependent in missing:
+                        missing.discard(dependent)
+                        reachable.add((dependent, depends_on_node))
+    return [(node, depends_on_node) in reachable for node, depends_on_node in node_pairs]
+
+
+# every dependency downstream of the seed tasks (the dependents of the seeds, their dependents...) as
+# (depends on task name, task name) rows. UNION drops tasks already seen, so a cycle in the data ends the recursion
+DOWNSTREAM_DEPENDENCIES_QUERY = '''
+WITH RECURSIVE downstream(id) AS (
+    SELECT id FROM {task} WHERE dependency_network_id = %s AND name IN ({names})
+    UNION
+    SELECT d.task_id FROM downstream s JOIN {dependency} d ON d.depends_on_task_id = s.id
+)
+SELECT depends_on.name, t.name
+FROM {dependency} d
+JOIN {task} t ON t.id = d.task_id
+JOIN {task} depends_on ON depends_on.id = d.depends_on_task_id
+WHERE d.depends_on_task_id IN (SELECT id FROM downstream)
+ORDER BY d.id
+'''
+
+
+# checks new dependencies, (task name, depends on task name) pairs, in the given order; the tasks don't have to exist
+# yet. returns the first cycle one of them would close as a list of names that starts and ends with its depends on
+# task, or None. a new dependency can only close a cycle through the tasks downstream of it, so only those are read,
+# with one query, instead of the whole network. run it in the transaction that writes the dependencies, with the
+# network row locked, or a concurrent write can close a cycle in between
+def find_new_cycle(dependency_network_id, dependencies):
+    dependents = defaultdict(list)
+    names = sorted({task for task, _ in dependencies})
+    if names:
+        query = DOWNSTREAM_DEPENDENCIES_QUERY.format(task=connection.ops.quote_name(Task._meta.db_table),
+                                                     dependency=connection.ops.quote_name(Dependency._meta.db_table),
+                                                     names=', '.join(['%s'] * len(names)))
+        with timed('graph'), connection.cursor() as cursor:
+            cursor.execute(query, [dependency_network_id] + names)
+            for depends_on_task, task in cursor.fetchall():
+                dependents[depends_on_task].append(task)
+    for task, depends_on_task in dependencies:
+        path = find_path(dependents, task, depends_on_task)
+        if path:
+            return [depends_on_task] + path
+        dependents[depends_on_task].append(task)
+    return None
+
+
+# depth-first search over dependents, returns the path from start to target or None
+def find_path(dependents, start, target):
+    parents = {start: None}
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            path = [node]
+            while parents[path[-1]] is not None:
+                path.append(parents[path[-1]])
+            return path[::-1]
+        for dependent in dependents.get(node, ()):
+            if dependent not in parents:
+                parents[dependent] = node
+                stack.append(dependent)
+    return None
+
+
+# yields the network as newline delimited json: one record per task, then one record per dependency.
+# rows are fetched from the db in chunks while the response is being sent, so memory stays flat
+def export_dependency_network(dependency_network_id, chunk_size=2000):
+    fields = ('id', 'name', 'description') + TIMING_FIELDS
+    tasks = Task.objects.filter(dependency_network_id=dependency_network_id).order_by('id').values_list(*fields)
+    for values in tasks.iterator(chunk_size=chunk_size):
+        record = {'type': 'task'}
+        record.update(zip(fields, values))
+        yield json.dumps(record) + '\n'
+    edges = Dependency.objects.filter(task__dependency_network_id=dependency_network_id,
+                                      depends_on_task__dependency_network_id=dependency_network_id) \
+        .order_by('id').values_list('task_id', 'depends_on_task_id')
+    for task_id, depends_on_task_id in edges.iterator(chunk_size=chunk_size):
+        yield json.dumps({'type': 'dependency', 'task': task_id, 'depends_on_task': depends_on_task_id}) + '\n'
+
+
+# returns one cycle as a list of nodes that starts and ends with the same node, or None if there is no cycle.
+# dependents maps every node to its children; iterative, so long chains can't hit the recursion limit
+def find_cycle(dependents):
+    visiting, visited = set(), set()
+    for start in dependents:
+        if start in visited:
+            continue
+        path = [start]
+        stack = [iter(dependents.get(start, ()))]
+        visiting.add(start)
+        while stack:
+            for child in stack[-1]:
+                if child in visiting:
+                    return path[path.index(child):] + [child]
+                if child not in visited:
+                    visiting.add(child)
+                    path.append(child)
+                    stack.append(iter(dependents.get(child, ())))
+                    break
+            else:
+                node = path.pop()
+                visiting.remove(node)
+                visited.add(node)
+                stack.pop()
+    return None
+
+
+# creates validated tasks and the dependencies between them (by task name) in one transaction.
+# bulk inserts bypass the model signals, so the version is bumped once for the whole import
+def import_network(dependency_network_id, tasks, dependencies):
+    with transaction.atomic(), deferred_version_bump(dependency_network_id):
+        Task.objects.bulk_create(Task(dependency_network_id=dependency_network_id,
+                                      name=task['name'],
+                                      description=task['description'],
+                                      **{field: task[field] for field in TIMING_FIELDS if field in task})
+                                 for task in tasks)
+        task_ids = record_created_tasks(dependency_network_id, {task['name'] for task in tasks})
+        create_dependencies(dependency_network_id, [(task_ids[dependency['task']],
+                                                     task_ids[dependency['depends_on_task']])
+                                                    for dependency in dependencies])
+
+
+# bulk_create sends no signals (and sets no ids on sqlite): reads the created tasks back for the change log.
+# returns the ids of all tasks of the network by name
+def record_created_tasks(dependency_network_id, names):
+    task_ids = {}
+    for task in Task.objects.filter(dependency_network_id=dependency_network_id):
+        task_ids[task.name] = task.id
+        if task.name in names:
+            record_change(dependency_network_id, 'task', 'create', task_data(task))
+    return task_ids
+
+
+# bulk creates (task id, depends on task id) dependencies and records them in the change log
+def create_dependencies(dependency_network_id, dependencies):
+    Dependency.objects.bulk_create(Dependency(task_id=task_id, depends_on_task_id=depends_on_task_id)
+                                   for task_id, depends_on_task_id in dependencies)
+    for task_id, depends_on_task_id in dependencies:
+        record_change(dependency_network_id, 'dependency', 'create',
+                      {'task': task_id, 'depends_on_task': depends_on_task_id})
+
+
+# per node, a digest of the task fields a diff compares (everything but id and name). cached with the graph
+def task_hashes(graph):
+    return [hashlib.md5('\0'.join((description, earliest_start, str(duration), latest_end)).encode('utf-8')).digest()
+            for description, earliest_start, duration, latest_end
+            in zip(graph.descriptions, graph.earliest_starts, graph.durations, graph.latest_ends)]
+
+
+# (task name, depends on task name) of every dependency, in the order they were created
+def named_edges(graph):
+    names = graph.names
+    return [(names[task], names[depends_on_task]) for task, depends_on_task in zip(graph.edge_tasks,
+                                                                                   graph.edge_depends_on)]
+
+
+# what changed from one graph to another, matching tasks by name: tasks only in new are added, only in old removed,
+# and tasks in both whose hashes differ are changed. linear in the size of both graphs, and works on snapshots too,
+# i.e. to compare a network with a snapshot exported last week
+def diff_graphs(old, new):
+    old_hashes = old.get_derived('task_hashes', task_hashes)
+    new_hashes = new.get_derived('task_hashes', task_hashes)
+    old_nodes, new_nodes = old.nodes_by_name, new.nodes_by_name
+    changed = []
+    for node, name in enumerate(new.names):
+        old_node = old_nodes.get(name)
+        if old_node is not None and old_hashes[old_node] != new_hashes[node]:
+            old_task, new_task = old.task(old_node), new.task(node)
+            changed.append({'name': name, 'changes': {
+                field: {'from': getattr(old_task, field), 'to': getattr(new_task, field)}
+                for field in ('description',) + TIMING_FIELDS if getattr(old_task, field) != getattr(new_task, field)}})
+    old_edges = old.get_derived('named_edges', named_edges)
+    new_edges = new.get_derived('named_edges', named_edges)
+    old_edge_set, new_edge_set = set(old_edges), set(new_edges)
+    return {
+        'tasks': {
+            'added': FlatTaskSerializer([new.task(node) for node, name in enumerate(new.names)
+                                         if name not in old_nodes], many=True).data,
+            'removed': FlatTaskSerializer([old.task(node) for node, name in enumerate(old.names)
+                                           if name not in new_nodes], many=True).data,
+            'changed': changed,
+        },
+        'dependencies': {
+            'added': [{'task': task, 'depends_on_task': depends_on_task} for task, depends_on_task in new_edges
+                      if (task, depends_on_task) not in old_edge_set],
+            'removed': [{'task': task, 'depends_on_task': depends_on_task} for task, depends_on_task in old_edges
+                        if (task, depends_on_task) not in new_edge_set],
+        },
+    }
+
+
+# copies every task of one network into another with two set-based statements, dependencies are remapped by task
+# name (unique per network, so every join hits one row of the unique index)
+CLONE_TASKS_QUERY = '''
+INSERT INTO {task} (dependency_network_id, {task_columns})
+SELECT %s, {task_columns} FROM {task} WHERE dependency_network_id = %s ORDER BY id
+'''
+CLONE_DEPENDENCIES_QUERY = '''
+INSERT INTO {dependency} (task_id, depends_on_task_id)
+SELECT clone.id, depends_on_clone.id
+FROM {dependency} d
+JOIN {task} t ON t.id = d.task_id
+JOIN {task} depends_on ON depends_on.id = d.depends_on_task_id
+JOIN {task} clone ON clone.dependency_network_id = %s AND clone.name = t.name
+JOIN {task} depends_on_clone ON depends_on_clone.dependency_network_id = %s AND depends_on_clone.name = depends_on.name
+WHERE t.dependency_network_id = %s
+ORDER BY d.id
+'''
+
+
+# fills the new, empty network with a copy of the tasks and dependencies of another one. the copy is not written to
+# the change log task by task, the clone starts at version 1 with a single ('network', 'clone') change instead
+def clone_network(dependency_network_id, clone_id):
+    names = {'task': connection.ops.quote_name(Task._meta.db_table),
+             'dependency': connection.ops.quote_name(Dependency._meta.db_table),
+             'task_columns': ', '.join(('name', 'description') + TIMING_FIELDS)}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(CLONE_TASKS_QUERY.format(**names), [clone_id, dependency_network_id])
+            cursor.execute(CLONE_DEPENDENCIES_QUERY.format(**names), [clone_id, clone_id, dependency_network_id])
+        bump_version(clone_id, [('network', 'clone', {'dependency_network': dependency_network_id})])
+
+
+def validate_text(value, field):
+    max_length = Task._meta.get_field(field).max_length
+    if not isinstance(value, str) or not value:
+        return 'This field is required.'
+    if len(value) > max_length:
+        return 'Ensure this field has no more than %d characters.' % max_length
+    return None
+
+
+def validate_timing(value, field):
+    if field == 'duration':
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            return 'A valid non-negative integer is required.'
+    elif not isinstance(value, str) or (value and not re.match(TIME_PATTERN, value)):
+        return time_validator.message
+    return None
+
+
+# validates an import of tasks and dependencies (referenced by task name) into an existing network in memory.
+# returns a dict of per-row errors, {'tasks': {index: [errors]}, 'dependencies': {index: [errors]}}, and
+# a 'cycle' entry when the rows are valid but would close a cycle. empty dict if the import can be written.
+def validate_network_import(graph, tasks, dependencies):
+    errors = {'tasks': {}, 'dependencies': {}}
+    names = set()
+    for index, task in enumerate(tasks):
+        row_errors = []
+        for field in ('name', 'description'):
+            error = validate_text(task.get(field) if isinstance(task, dict) else None, field)
+            if error:
+                row_errors.append('%s: %s' % (field, error))
+        for field in TIMING_FIELDS:
+            if isinstance(task, dict) and field in task:
+                error = validate_timing(task[field], field)
+                if error:
+                    row_errors.append('%s: %s' % (field, error))
+        if not row_errors:
+            if task['name'] in names:
+                row_errors.append('name: duplicate task name %r.' % task['name'])
+            elif task['name'] in graph.nodes_by_name:
+                row_errors.append('name: task %r already exists in this dependency network.' % task['name'])
+            names.add(task['name'])
+        if row_errors:
+            errors['tasks'][index] = row_errors
+
+    known_names = names | set(graph.nodes_by_name)
+    dependents = {name: [] for name in known_names}
+    edges = set()
+    for task, depends_on_task in zip(graph.edge_tasks, graph.edge_depends_on):
+        edge = (graph.names[task], graph.names[depends_on_task])
+        dependents[edge[1]].append(edge[0])
+        edges.add(edge)
+    for index, dependency in enumerate(dependencies):
+        row_errors = []
+        for field in ('task', 'depends_on_task'):
+            name = dependency.get(field) if isinstance(dependency, dict) else None
+            if not isinstance(name, str) or name not in known_names:
+                row_errors.append('%s: unknown task %r.' % (field, name))
+        if not row_errors:
+            edge = (dependency['task'], dependency['depends_on_task'])
+            if edge in edges:
+                row_errors.append('duplicate dependency of %r on %r.' % edge)
+            else:
+                edges.add(edge)
+                dependents[edge[1]].append(edge[0])
+        if row_errors:
+            errors['dependencies'][index] = row_errors
+
+    if errors['tasks'] or errors['dependencies']:
+        return errors
+    cycle = find_cycle(dependents)
+    if cycle:
+        return {'cycle': cycle}
+    return {}
+
+
+GRAPH_EDIT_OPERATIONS = ('add_task', 'rename_task', 'delete_task', 'add_dependency', 'remove_dependency')
+
+
+# replays an ordered list of edit operations on the graph in memory and returns what has to be written, as
+# (changes, errors). errors are per operation, {index: [errors]}, or {'cycle': [names]} when the operations are valid
+# but the edited network has a cycle; changes is None unless there are no errors. tasks are tracked by node (or
+# ('new', index) for added ones), so a task that is deleted and added again under the same name is a new task.
+#
+#   {'op': 'add_task', 'name': ..., 'description': ..., 'duration': ...}   timing fields are optional
+#   {'op': 'rename_task', 'name': ..., 'new_name': ...}
+#   {'op': 'delete_task', 'name': ...}                                     its dependencies go with it
+#   {'op': 'add_dependency', 'task': ..., 'depends_on_task': ...}          adding an existing one is a no-op
+#   {'op': 'remove_dependency', 'task': ..., 'depends_on_task': ...}
+def plan_graph_edits(graph, operations):
+    keys_by_name = dict(graph.nodes_by_name)
+    names = dict(enumerate(graph.names))
+    new_tasks = {}
+    initial_edges = set(zip(graph.edge_tasks, graph.edge_depends_on))
+    edges = set(initial_edges)
+    # the edges of deleted tasks are dropped at the end, no later operation can refer to them
+    deleted = set()
+    errors = {}
+
+    def existing(operation, field):
+        name = operation.get(field)
+        if not isinstance(name, str) or name not in keys_by_name:
+            return None, '%s: unknown task %r.' % (field, name)
+        return keys_by_name[name], None
+
+    for index, operation in enumerate(operations):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        row_errors = []
+        if op not in GRAPH_EDIT_OPERATIONS:
+            row_errors.append('op: one of %s is required.' % ', '.join(GRAPH_EDIT_OPERATIONS))
+        elif op == 'add_task':
+            for field in ('name', 'description'):
+                error = validate_text(operation.get(field), field)
+                if error:
+                    row_errors.append('%s: %s' % (field, error))
+            for field in TIMING_FIELDS:
+                error = validate_timing(operation[field], field) if field in operation else None
+                if error:
+                    row_errors.append('%s: %s' % (field, error))
+            if not row_errors and operation['name'] in keys_by_name:
+                row_errors.append('name: task %r already exists in this dependency network.' % operation['name'])
+            if not row_errors:
+                key = ('new', index)
+                keys_by_name[operation['name']] = key
+                names[key] = operation['name']
+                new_tasks[key] = {field: operation[field] for field in ('description',) + TIMING_FIELDS
+                                  if field in operation}
+        elif op == 'rename_task':
+            key, error = existing(operation, 'name')
+            new_name = operation.get('new_name')
+            name_error = validate_text(new_name, 'name')
+            row_errors.extend(filter(None, [error, name_error and 'new_name: %s' % name_error]))
+            if not row_errors and new_name != operation['name'] and new_name in keys_by_name:
+                row_errors.append('new_name: task %r already exists in this dependency network.' % new_name)
+            if not row_errors:
+                del keys_by_name[operation['name']]
+                keys_by_name[new_name] = key
+                names[key] = new_name
+        elif op == 'delete_task':
+            key, error = existing(operation, 'name')
+            if error:
+                row_errors.append(error)
+            else:
+                del keys_by_name[operation['name']], names[key]
+                new_tasks.pop(key, None)
+                deleted.add(key)
+        else:
+            key, error = existing(operation, 'task')
+            depends_on_key, depends_on_error = existing(operation, 'depends_on_task')
+            row_errors.extend(filter(None, [error, depends_on_error]))
+            if not row_errors and op == 'add_dependency':
+                edges.add((key, depends_on_key))
+            elif not row_errors:
+                if (key, depends_on_key) not in edges:
+                    row_errors.append('no dependency of %r on %r.' % (operation['task'], operation['depends_on_task']))
+                edges.discard((key, depends_on_key))
+        if row_errors:
+            errors[index] = row_errors
+    if errors:
+        return None, errors
+
+    edges = {edge for edge in edges if edge[0] not in deleted and edge[1] not in deleted}
+    dependents = {name: [] for name in names.values()}
+    for key, depends_on_key in edges:
+        dependents[names[depends_on_key]].append(names[key])
+    cycle = find_cycle(dependents)
+    if cycle:
+        return None, {'cycle': cycle}
+
+    nodes = range(len(graph))
+    return {
+        'deleted_tasks': [graph.ids[node] for node in nodes if node not in names],
+        'renamed_tasks': {graph.ids[node]: names[node] for node in nodes
+                          if node in names and names[node] != graph.names[node]},
+        'created_tasks': [dict(new_tasks[key], name=names[key]) for key in sorted(new_tasks)],
+        # dependencies of deleted tasks are deleted with them
+        'deleted_dependencies': [(graph.ids[key], graph.ids[depends_on_key])
+                                 for key, depends_on_key in initial_edges - edges
+                                 if key in names and depends_on_key in names],
+        'created_dependencies': [(names[key], names[depends_on_key]) for key, depends_on_key in edges - initial_edges],
+    }, {}
 
 
-def assign_dependents_recursively(task):
-    try:
-        task.dependencies = []
-        task.dependents = []
-        dependency_entries = list(Dependency.objects.filter(depends_on_task_id=task.id))
-        if dependency_entries:
-            for dependency_entry in dependency_entries:
-                dependent_task = dependency_entry.task
-                assign_dependents_recursively(dependent_task)
-                task.dependents.append(dependent_task)
-    except Dependency.DoesNotExist:
-        task.dependents = list()
-
-
-def assign_dependencies_recursively(task):
-    try:
-        task.dependencies = []
-        task.dependents = []
-        dependency_entries = list(Dependency.objects.filter(task_id=task.id))
-        if dependency_entries:
-            for dependency_entry in dependency_entries:
-                parent_task = dependency_entry.depends_on_task
-                assign_dependencies_recursively(parent_task)
-                task.dependencies.append(parent_task)
-
-    except Dependency.DoesNotExist:
-        task.dependencies = list()
+# writes the changes planned by plan_graph_edits in one transaction, with bulk queries and one version bump
+def apply_graph_edits(dependency_network_id, changes):
+    with transaction.atomic(), deferred_version_bump(dependency_network_id):
+        deleted_dependencies = sorted(set(changes['deleted_dependencies']))
+        # in batches, sqlite limits the depth of an expression (a OR b OR c... nests)
+        for start in range(0, len(deleted_dependencies), 500):
+            Dependency.objects.filter(reduce(operator.or_, (
+                Q(task_id=task_id, depends_on_task_id=depends_on_task_id)
+                for task_id, depends_on_task_id in deleted_dependencies[start:start + 500]))).delete()
+        if changes['deleted_tasks']:
+            Task.objects.filter(id__in=changes['deleted_tasks']).delete()
+        if changes['renamed_tasks']:
+            # through temporary names first, so tasks can swap names without hitting the unique constraint. no
+            # real task is named like a uuid (postgres can't store a nul character to rule that out)
+            renamed = list(Task.objects.filter(id__in=changes['renamed_tasks']))
+            for task in renamed:
+                task.name = uuid.uuid4().hex
+            Task.objects.bulk_update(renamed, ['name'])
+            for task in renamed:
+                task.name = changes['renamed_tasks'][task.id]
+            Task.objects.bulk_update(renamed, ['name'])
+            for task in renamed:
+                record_change(dependency_network_id, 'task', 'update', task_data(task))
+        Task.objects.bulk_create(Task(dependency_network_id=dependency_network_id, **task)
+                                 for task in changes['created_tasks'])
+        if changes['created_tasks'] or changes['created_dependencies']:
+            task_ids = record_created_tasks(dependency_network_id,
+                                            {task['name'] for task in changes['created_tasks']})
+            create_dependencies(dependency_network_id, [(task_ids[task], task_ids[depends_on])
+                                                        for task, depends_on in changes['created_dependencies']])
@@ -1,11 +1,21 @@
+from collections import Counter
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from rest_framework import status
-from rest_framework.authentication import SessionAuthentication, BasicAuthentication, TokenAuthentication
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
+from .authentication import CachedBasicAuthentication, CachedTokenAuthentication
+from .scheduling import evaluate_scenarios, get_schedule, propagate_delay
+from .snapshot import render_dependency_network_snapshot
 from .utils import *
 from .serializer import *
+from .signals import deferred_version_bump, suppress_changes
 from .models import *
 
 
@@ -20,21 +30,206 @@ def get_all_dependency_networks(request):
 def get_dependency_network(request, aircraft_type):
     try:
         dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
-        all_tasks = Task.objects.filter(dependency_network_id=dependency_network.id)
-        dependency_entries = Dependency.objects.filter(id__in=list(t.id for t in all_tasks))
-        root_tasks = list(all_tasks.exclude(id__in=list(d.task_id for d in dependency_entries)))
-        data = []
-        for root_task in root_tasks:
-            assign_dependents_recursively(root_task)
-            data.append(root_task)
-        serializer = TaskSerializer(data, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
     except DependencyNetwork.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+    layout = 'flat' if request.query_params.get('layout') == 'flat' else 'nested'
+    # the browsable api needs the data itself, json clients get the bytes rendered once per network version
+    if request.accepted_renderer.format != 'json':
+        return Response(serialize_dependency_network(dependency_network, layout), status=status.HTTP_200_OK)
+    content, etag = render_dependency_network(dependency_network, layout)
+    response = get_conditional_response(request, etag=etag) or HttpResponse(content,
+                                                                            content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@api_view(['GET'])
+def get_dependency_network_snapshot(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    content, etag = render_dependency_network_snapshot(dependency_network)
+    response = get_conditional_response(request, etag=etag) or HttpResponse(content,
+                                                                            content_type='application/octet-stream')
+    response['ETag'] = etag
+    return response
+
+
+# tasks in topological order with their level (longest path from a root), and grouped into waves by level
+@api_view(['GET'])
+def get_dependency_network_levels(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        content, etag = render_topological_levels(dependency_network)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+    response = get_conditional_response(request, etag=etag) or HttpResponse(content,
+                                                                            content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@api_view(['GET'])
+def get_root_tasks_of_dependency_network(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    serializer = FlatTaskSerializer(get_root_tasks(dependency_network.id), many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_leaf_tasks_of_dependency_network(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    serializer = FlatTaskSerializer(get_leaf_tasks(dependency_network.id), many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_dependency_network_changes(request, aircraft_type):
+    since = request.query_params.get('since', '0')
+    if not since.isdigit():
+        return Response({'since': ['A valid non-negative integer is required.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    changes = get_changes_since(dependency_network.id, int(since))
+    return Response({'version': dependency_network.version, 'resync': changes is None, 'changes': changes or []},
+                    status=status.HTTP_200_OK)
+
+
+# tasks and dependencies added, removed and changed from the first network to the second one, matched by name
+@api_view(['GET'])
+def get_dependency_network_diff(request, aircraft_type, other_aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+        other_dependency_network = DependencyNetwork.objects.get(aircraft_type=other_aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    return Response(diff_graphs(get_dependency_graph(dependency_network),
+                                get_dependency_graph(other_dependency_network)), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def export_dependency_network_stream(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    return StreamingHttpResponse(export_dependency_network(dependency_network.id),
+                                 content_type='application/x-ndjson')
+
+
+@api_view(['POST'])
+def get_reachability(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    pairs = request.data.get('pairs', None)
+    if not isinstance(pairs, list):
+        return Response({'pairs': ['A list of [task, depends_on_task] pairs is required.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    graph = get_dependency_graph(dependency_network)
+    node_pairs = []
+    errors = {}
+    for index, pair in enumerate(pairs):
+        try:
+            task_name, depends_on_task_name = pair
+            node_pairs.append((graph.get_task(task_name).node, graph.get_task(depends_on_task_name).node))
+        except (TypeError, ValueError, Task.DoesNotExist):
+            errors[index] = ['%r is not a pair of existing task names.' % (pair,)]
+    if errors:
+        return Response({'pairs': errors}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        results = check_reachability(dependency_network, node_pairs)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_dependency_network_schedule(request, aircraft_type):
+    ground_time = request.query_params.get('ground_time', None)
+    if ground_time is not None:
+        if not ground_time.isdigit():
+            return Response({'ground_time': ['A valid non-negative integer is required.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ground_time = int(ground_time)
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        schedule = get_schedule(get_dependency_graph(dependency_network), dependency_network, ground_time)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(schedule, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def evaluate_dependency_network_scenarios(request, aircraft_type):
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+    except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    task_names = request.data.get('tasks', None)
+    ground_time = request.data.get('ground_time', dependency_network.ground_time)
+    if not isinstance(task_names, list):
+        return Response({'tasks': ['A list of task names is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    # every name is one column of durations, a repeated name would silently take the duration of its last column
+    duplicates = sorted(name for name, count in Counter(name for name in task_names if isinstance(name, str)).items()
+                        if count > 1)
+    if duplicates:
+        return Response({'tasks': ['Duplicate task names: %s.' % ', '.join(duplicates)]},
+                        status=status.HTTP_400_BAD_REQUEST)
+    # bool is an int too
+    if ground_time is not None and (not isinstance(ground_time, int) or isinstance(ground_time, bool) or
+                                    ground_time < 0):
+        return Response({'ground_time': ['A valid non-negative integer is required.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        durations = np.array(request.data.get('durations', None), dtype=np.float64)
+    except (TypeError, ValueError):
+        durations = None
+    if durations is None or durations.ndim != 2 or durations.shape[1] != len(task_names) or \
+            not np.isfinite(durations).all() or (durations < 0).any():
+        return Response({'durations': ['A (scenarios x tasks) matrix of non-negative durations is required.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        results = evaluate_scenarios(get_dependency_graph(dependency_network), task_names, durations, ground_time)
+    except Task.DoesNotExist:
+        return Response({'tasks': ['All tasks must exist in the dependency network.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(results, status=status.HTTP_200_OK)
+
 
 @api_view(['DELETE', 'PUT'])
-@authentication_classes((SessionAuthentication, BasicAuthentication, TokenAuthentication))
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
 @permission_classes((IsAuthenticated,))
 def delete_update_dependency_network(request, aircraft_type):
     try:
@@ -49,12 +244,13 @@ def delete_update_dependency_network(request, aircraft_type):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     if request.method == 'DELETE':
-        dependency_network.delete()
+        with suppress_changes(dependency_network.id):
+            dependency_network.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['POST'])
-@authentication_classes((SessionAuthentication, BasicAuthentication, TokenAuthentication))
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
 @permission_classes((IsAuthenticated,))
 def create_dependency_network(request):
     serializer = DependencyNetworkSerializer(data=request.data)
@@ -74,18 +270,76 @@ def create_dependency_network(request):
 def get_task(request, aircraft_type, name):
     try:
         dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
-        task = Task.objects.get(dependency_network_id=dependency_network.id, name=name)
-        assign_dependencies_recursively(task)
-        assign_dependents_recursively(task)
+        task = get_dependency_graph(dependency_network).get_task(name)
 
-        serializer = TaskSerializer(task)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with timed('serialize'):
+            data = TaskSerializer(task).data
+        return Response(data, status=status.HTTP_200_OK)
     except (DependencyNetwork.DoesNotExist, Task.DoesNotExist):
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+def get_upstream_tasks(request, aircraft_type, name):
+    return get_task_closure(request, aircraft_type, name, 'dependencies')
+
+
+@api_view(['GET'])
+def get_downstream_tasks(request, aircraft_type, name):
+    return get_task_closure(request, aircraft_type, name, 'dependents')
+
+
+@api_view(['GET'])
+def get_task_delay_impact(request, aircraft_type, name):
+    errors = {}
+    values = {}
+    for parameter in ('minutes', 'ground_time'):
+        value = request.query_params.get(parameter, None)
+        if value is not None and not value.isdigit():
+            errors[parameter] = ['A valid non-negative integer is required.']
+        values[parameter] = None if value is None or not value.isdigit() else int(value)
+    if not values['minutes']:
+        errors.setdefault('minutes', ['A positive number of minutes is required.'])
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+        graph = get_dependency_graph(dependency_network)
+        task = graph.get_task(name)
+    except (DependencyNetwork.DoesNotExist, Task.DoesNotExist):
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        impact = propagate_delay(graph, dependency_network, task, values['minutes'], values['ground_time'])
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(impact, status=status.HTTP_200_OK)
+
+
+def get_task_closure(request, aircraft_type, name, direction):
+    depth = request.query_params.get('depth', None)
+    if depth is not None:
+        if not depth.isdigit() or int(depth) < 1:
+            return Response({'depth': ['A positive integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        depth = int(depth)
+    try:
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
+        # a cold cache is not warmed up for a single closure, the db computes it instead of loading the whole network
+        graph = get_cached_dependency_graph(dependency_network)
+        if graph is None:
+            task = query_task_closure(dependency_network.id, name, direction, depth)
+        else:
+            task = graph.get_task(name)
+    except (DependencyNetwork.DoesNotExist, Task.DoesNotExist):
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    if request.query_params.get('layout') == 'flat':
+        return Response(walk_flat(task, direction, depth), status=status.HTTP_200_OK)
+    return Response(walk_nested(task, direction, depth), status=status.HTTP_200_OK)
+
+
 @api_view(['DELETE', 'PUT'])
-@authentication_classes((SessionAuthentication, BasicAuthentication, TokenAuthentication))
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
 @permission_classes((IsAuthenticated,))
 def delete_update_task(request, aircraft_type, name):
     try:
@@ -100,23 +354,34 @@ def delete_update_task(request, aircraft_type, name):
                 'description': request.data.get('description', None),
                 'dependents': [],
                 'dependencies': []}
+        for field in TIMING_FIELDS:
+            data[field] = request.data.get(field, getattr(task, field))
         serializer = TaskSerializer(data=data)
 
         if serializer.is_valid():
-            data.pop('dependents')
-            data.pop('dependencies')
-            task = Task.objects.create(**data)
+            task.name = data['name']
+            task.description = data['description']
+            for field in TIMING_FIELDS:
+                setattr(task, field, serializer.validated_data[field])
+            try:
+                with transaction.atomic():
+                    task.save()
+            except IntegrityError:
+                # another task of the same dependency network already has this name
+                return Response(status=status.HTTP_409_CONFLICT)
 
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     if request.method == 'DELETE':
-        task.delete()
+        # the cascaded dependency deletes share the version of the task delete
+        with transaction.atomic(), deferred_version_bump(task.dependency_network_id):
+            task.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['POST'])
-@authentication_classes((SessionAuthentication, BasicAuthentication, TokenAuthentication))
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
 @permission_classes((IsAuthenticated,))
 def create_single_task(request):
     task = create_task(request.data)
@@ -124,7 +389,7 @@ def create_single_task(request):
 
 
 @api_view(['POST'])
-@authentication_classes((SessionAuthentication, BasicAuthentication, TokenAuthentication))
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
 @permission_classes((IsAuthenticated,))
 def create_tasks(request):
     main_task = request.data.get('task', None)
@@ -136,46 +401,132 @@ def create_tasks(request):
         return Response(status=status.HTTP_400_BAD_REQUEST)
     if children_tasks and not all(ct.get('dependency_network_id', None) == network_id for ct in children_tasks):
         return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    # if so far so good, let's create
-    task = create_task(main_task)
-    if not task:
-        Response(status=status.HTTP_400_BAD_REQUEST)
-    partial_failure = False
-    if parent_tasks:
-        for parent_task in parent_tasks:
-            pt = create_task(parent_task)
-            if not pt:
-                partial_failure = True
-            else:
-                task_id = pt.id if isinstance(pt, Task) else pt.get('id')
-                Dependency.objects.create(task_id=task.id, depends_on_task_id=task_id)
-    if children_tasks:
-        for children_task in children_tasks:
-            ct = create_task(children_task)
-            if not ct:
-                partial_failure = True
-            else:
-                task_id = ct.id if isinstance(ct, Task) else ct.get('id')
-                Dependency.objects.create(task_id=task_id, depends_on_task_id=task.id)
+    with transaction.atomic():
+        # writers of one network queue up here, so no other write can close a cycle after the check (on sqlite they
+        # get a 503 to retry instead, see exceptions.py)
+        dependency_network = DependencyNetwork.objects.select_for_update().filter(id=network_id).first()
+        if not dependency_network:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        # existing tasks may be linked in a way that closes a cycle, check all new dependencies before creating
+        # anything
+        new_dependencies = [(main_task, parent_task) for parent_task in parent_tasks or []] + \
+                           [(children_task, main_task) for children_task in children_tasks or []]
+        cycle = find_new_cycle(dependency_network.id, [
+            (child_data['name'], parent_data['name']) for child_data, parent_data in new_dependencies
+            if isinstance(child_data.get('name'), str) and isinstance(parent_data.get('name'), str)])
+        if cycle:
+            return cycle_response(cycle)
+
+        # if so far so good, let's create
+        task = create_task(main_task)
+        if not task:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        partial_failure = False
+        if parent_tasks:
+            for parent_task in parent_tasks:
+                pt = create_task(parent_task)
+                if not pt:
+                    partial_failure = True
+                else:
+                    task_id = pt.id if isinstance(pt, Task) else pt.get('id')
+                    Dependency.objects.get_or_create(task_id=task.id, depends_on_task_id=task_id)
+        if children_tasks:
+            for children_task in children_tasks:
+                ct = create_task(children_task)
+                if not ct:
+                    partial_failure = True
+                else:
+                    task_id = ct.id if isinstance(ct, Task) else ct.get('id')
+                    Dependency.objects.get_or_create(task_id=task_id, depends_on_task_id=task.id)
     return Response(status=status.HTTP_201_CREATED) if not partial_failure else Response(
         status=status.HTTP_206_PARTIAL_CONTENT)
 
 
-def create_task(data):
-    dependency_network_id = data.get('dependency_network_id', None)
+@api_view(['POST'])
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
+@permission_classes((IsAuthenticated,))
+def import_dependency_network(request, aircraft_type):
+    tasks = request.data.get('tasks', [])
+    dependencies = request.data.get('dependencies', [])
+    if not isinstance(tasks, list) or not isinstance(dependencies, list):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        # writers of one network queue up here (on sqlite they get a 503 to retry instead, see exceptions.py), the
+        # import is validated and checked for cycles on the state it is written to
+        try:
+            dependency_network = DependencyNetwork.objects.select_for_update().get(aircraft_type=aircraft_type)
+        except DependencyNetwork.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        errors = validate_network_import(get_dependency_graph(dependency_network), tasks, dependencies)
+        if 'cycle' in errors:
+            return cycle_response(errors['cycle'])
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            import_network(dependency_network.id, tasks, dependencies)
+        except IntegrityError:
+            # a task of the same name was created by a request that doesn't lock the network in the meantime
+            return Response(status=status.HTTP_409_CONFLICT)
+    return Response({'tasks': len(tasks), 'dependencies': len(dependencies)}, status=status.HTTP_201_CREATED)
+
+
+# copies the whole network, tasks and dependencies, to a new aircraft type. description and ground time default to
+# the ones of the copied network
+@api_view(['POST'])
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
+@permission_classes((IsAuthenticated,))
+def clone_dependency_network(request, aircraft_type):
     try:
-        DependencyNetwork.objects.get(id=dependency_network_id)
-        task = Task.objects.get(dependency_network_id=dependency_network_id,
-                                name=data['name'])
-        # if a task with given data exists, return task
-        if task:
-            return task
-        # if given dependency network not exists, return bad request
+        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
     except DependencyNetwork.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    data = {'description': dependency_network.description, 'ground_time': dependency_network.ground_time}
+    data.update(request.data.items())
+    serializer = DependencyNetworkSerializer(data=data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        clone = serializer.save()
+        clone_network(dependency_network.id, clone.id)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+# many task and dependency edits in one request and one transaction, either all of them are written or none.
+# see plan_graph_edits for the operations
+@api_view(['POST'])
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
+@permission_classes((IsAuthenticated,))
+def edit_dependency_network(request, aircraft_type):
+    operations = request.data.get('operations', None)
+    if not isinstance(operations, list):
+        return Response({'operations': ['A list of operations is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        # writers of one network queue up here (on sqlite they get a 503 to retry instead, see exceptions.py), the
+        # edits are planned and checked for cycles on the state they are written to
+        try:
+            dependency_network = DependencyNetwork.objects.select_for_update().get(aircraft_type=aircraft_type)
+        except DependencyNetwork.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        changes, errors = plan_graph_edits(get_dependency_graph(dependency_network), operations)
+        if 'cycle' in errors:
+            return cycle_response(errors['cycle'])
+        if errors:
+            return Response({'operations': errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            apply_graph_edits(dependency_network.id, changes)
+        except IntegrityError:
+            # a task was changed by a request that doesn't lock the network in the meantime
+            return Response(status=status.HTTP_409_CONFLICT)
+    return Response({change: len(changed) for change, changed in changes.items()}, status=status.HTTP_200_OK)
+
+
+def create_task(data):
+    dependency_network_id = data.get('dependency_network_id', None)
+    # if given dependency network not exists, return bad request
+    if not DependencyNetwork.objects.filter(id=dependency_network_id).exists():
         return None
-    except Task.DoesNotExist:
-        pass
 
     if not data.get('dependents', None):
         data['dependents'] = []
@@ -184,34 +535,53 @@ def create_task(data):
 
     serializer = TaskSerializer(data=data)
     if serializer.is_valid():
-        task = Task.objects.create(dependency_network_id=data['dependency_network_id'],
-                                   name=data['name'],
-                                   description=data['description'])
+        # if a task with given name exists in the network, return that task
+        defaults = {field: serializer.validated_data[field] for field in TIMING_FIELDS
+                    if field in serializer.validated_data}
+        defaults['description'] = data['description']
+        task, _ = Task.objects.get_or_create(dependency_network_id=data['dependency_network_id'],
+                                             name=data['name'],
+                                             defaults=defaults)
         return task
     return None
 
 
 @api_view(['POST', 'DELETE'])
-@authentication_classes((SessionAuthentication, BasicAuthentication, TokenAuthentication))
+@authentication_classes((SessionAuthentication, CachedBasicAuthentication, CachedTokenAuthentication))
 @permission_classes((IsAuthenticated,))
 def create_delete_dependency(request, aircraft_type):
-    try:
-        dependency_network = DependencyNetwork.objects.get(aircraft_type=aircraft_type)
-        child_task = Task.objects.get(dependency_network_id=dependency_network.id,
-                                      name=request.data.get('task'))
-        parent_task = Task.objects.get(dependency_network_id=dependency_network.id,
-                                       name=request.data.get("depends_on_task"))
-    except (Task.DoesNotExist, DependencyNetwork.DoesNotExist):
+    task_name, depends_on_task_name = request.data.get('task'), request.data.get('depends_on_task')
+    if not isinstance(task_name, str) or not isinstance(depends_on_task_name, str):
         return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    if request.method == 'POST':
-        Dependency.objects.create(task_id=child_task.id, depends_on_task_id=parent_task.id)
-        return Response(status=status.HTTP_201_CREATED)
-    elif request.method == 'DELETE':
+    with transaction.atomic():
+        # writers of one network queue up here, so no other write can close a cycle after the check (on sqlite they
+        # get a 503 to retry instead, see exceptions.py)
         try:
-            dependency = Dependency.objects.get(task_id=child_task.id,
-                                                depends_on_task_id=parent_task.id)
-            dependency.delete()
-            return Response(status=status.HTTP_200_OK)
-        except Dependency.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+            dependency_network = DependencyNetwork.objects.select_for_update().get(aircraft_type=aircraft_type)
+        except DependencyNetwork.DoesNotExist:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        task_ids = dict(Task.objects.filter(dependency_network=dependency_network,
+                                            name__in=(task_name, depends_on_task_name)).values_list('name', 'id'))
+        if task_name not in task_ids or depends_on_task_name not in task_ids:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'POST':
+            cycle = find_new_cycle(dependency_network.id, [(task_name, depends_on_task_name)])
+            if cycle:
+                return cycle_response(cycle)
+            _, created = Dependency.objects.get_or_create(task_id=task_ids[task_name],
+                                                          depends_on_task_id=task_ids[depends_on_task_name])
+            return Response(status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        elif request.method == 'DELETE':
+            try:
+                dependency = Dependency.objects.get(task_id=task_ids[task_name],
+                                                    depends_on_task_id=task_ids[depends_on_task_name])
+                dependency.delete()
+                return Response(status=status.HTTP_200_OK)
+            except Dependency.DoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+
+
+# cycle: task names
+def cycle_response(cycle):
+    return Response({'detail': 'Dependency would create a cycle.', 'cycle': cycle}, status=status.HTTP_409_CONFLICT)